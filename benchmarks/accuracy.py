@@ -0,0 +1,186 @@
+"""
+Accuracy versus cost of the engines of nphc on simulated Hawkes processes (see `suite.hawkes_params`),
+over a grid of durations T, half widths, filters, methods of `compute_cumulants` and solvers.
+
+For each case, the relative errors (`nphc.utils.metrics.rel_err`) of L, C and K_c with respect to the
+theoretical cumulants, and of the estimated G with respect to the true kernel norms, are recorded along
+with the wall times of `NPHC.fit` and `NPHC.solve` and the peak resident memory. The errors are averaged
+over `--seeds` simulations, each case runs in a fresh interpreter.
+
+The Pareto tables list, for each dimension and duration, the configurations that no other configuration beats on both
+the cost (time or memory) and the error: the others are never worth using.
+
+Usage: python benchmarks/accuracy.py [--d 4] [--T 1e3 1e4 1e5] [--half-width 5 10 20]
+                                     [--filtr rectangular gaussian] [--method parallel_by_day partial_sums]
+                                     [--solver lbfgs newton fista_approximate] [--seeds 3] [--output results.json]
+"""
+from itertools import product
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+from suite import ROOT, hawkes_params, peak_memory, key, machine
+
+
+# keyword arguments of `NPHC.solve` for each solver, always with backend='numpy'
+SOLVERS = {
+    'lbfgs': dict(solver='lbfgs'),
+    'lbfgs_G': dict(solver='lbfgs', space='G'),
+    'newton': dict(solver='newton'),
+    'fista_exact': dict(solver='fista', projection_stable_G=True, projection_method='exact'),
+    'fista_approximate': dict(solver='fista', projection_stable_G=True, projection_method='approximate'),
+}
+
+ERRORS = ['err_L', 'err_C', 'err_K_c', 'err_G']
+
+
+def run_case(case, seed):
+    """
+    Simulates a Hawkes process, fits and solves it in this interpreter, and returns the errors and costs.
+    The kernels are compiled on a small slice of the realization first, as in `suite.run_case`.
+    """
+    import numpy as np
+    from scipy.linalg import inv
+    from nphc.main import NPHC
+    from nphc.utils.metrics import rel_err
+    from nphc.utils.simulate_data import simulate_hawkes_exp
+    d = case['d']
+    mu, Alpha, Beta = hawkes_params(d)
+    realization = simulate_hawkes_exp(mu, Alpha, Beta, float(case['T']), random_state=seed)
+    solve_args = dict(backend='numpy', display_step=10 ** 9, **SOLVERS[case['solver']])
+    warm_up = NPHC()
+    warm_up.fit([[x[:1000] for x in realization]], half_width=case['half_width'], filtr=case['filtr'],
+                method=case['method'], verbose=False)
+    warm_up.solve(training_epochs=2, **solve_args)
+    nphc = NPHC()
+    start = time.time()
+    nphc.fit([realization], half_width=case['half_width'], filtr=case['filtr'], method=case['method'],
+             mu_true=mu, R_true=inv(np.eye(d) - Alpha), verbose=False)
+    fit_time = time.time() - start
+    start = time.time()
+    R = nphc.solve(training_epochs=1000, **solve_args)
+    solve_time = time.time() - start
+    G = np.eye(d) - inv(R)
+    res = dict(err_L=rel_err(nphc.L_th, nphc.L[0]), err_C=rel_err(nphc.C_th, nphc.C[0]),
+               err_K_c=rel_err(nphc.K_c_th, nphc.K_c[0]), err_G=rel_err(Alpha, G),
+               fit_time=fit_time, solve_time=solve_time)
+    res['peak_memory'] = peak_memory()[0]
+    return res
+
+
+def run_in_subprocess(case, seed, timeout):
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join([ROOT, os.environ.get('PYTHONPATH', '')]))
+    try:
+        out = subprocess.check_output([sys.executable, os.path.abspath(__file__), '--case', key(case),
+                                       '--seed', str(seed)], timeout=timeout, env=env, stderr=subprocess.DEVNULL)
+    except subprocess.TimeoutExpired:
+        return dict(error='timeout')
+    except subprocess.CalledProcessError as e:
+        return dict(error='exit status %d' % e.returncode)
+    return json.loads(out.decode().strip().splitlines()[-1])
+
+
+def run(grid, seeds=3, timeout=3600.):
+    """
+    Returns the results of the cases of `grid`, averaged over the seeds.
+    """
+    results = []
+    names = ['d', 'T', 'half_width', 'filtr', 'method', 'solver']
+    print("%-96s %9s %9s %9s %9s %9s %9s %9s" % ("case", "err_L", "err_C", "err_K_c", "err_G", "fit (s)",
+                                                 "solve (s)", "mem (MB)"))
+    for values in product(*[grid[name] for name in names]):
+        case = dict(zip(names, values))
+        runs = [run_in_subprocess(case, seed, timeout) for seed in range(seeds)]
+        errors = [r['error'] for r in runs if 'error' in r]
+        description = " ".join("%s=%s" % (name, case[name]) for name in names)
+        if errors:
+            results.append(dict(case=case, error=errors[0]))
+            print("%-96s %s" % (description, errors[0]))
+            continue
+        res = dict(case=case)
+        for measure in ERRORS + ['fit_time', 'solve_time']:
+            res[measure] = sum(r[measure] for r in runs) / len(runs)
+        res['time'] = res['fit_time'] + res['solve_time']
+        res['peak_memory'] = max(r['peak_memory'] for r in runs)
+        results.append(res)
+        print("%-96s %9.3g %9.3g %9.3g %9.3g %9.3g %9.3g %9.1f" % tuple(
+            [description] + [res[m] for m in ERRORS + ['fit_time', 'solve_time']] + [res['peak_memory'] / 2. ** 20]))
+        sys.stdout.flush()
+    return dict(machine=machine(), date=time.strftime('%Y-%m-%d %H:%M:%S'), seeds=seeds, results=results)
+
+
+def pareto_front(rows, cost, error, rtol=1e-3):
+    """
+    Returns the rows that are not dominated on (`cost`, `error`), sorted by increasing cost:
+    each one has a lower error than all the cheaper ones, by more than `rtol` in relative terms
+    (solvers reaching the same optimum only differ by rounding errors).
+    """
+    res = []
+    for row in sorted(rows, key=lambda r: (r[cost], r[error])):
+        if len(res) == 0 or row[error] < res[-1][error] * (1 - rtol):
+            res.append(row)
+    return res
+
+
+def pareto_tables(results, errors=('err_K_c', 'err_G'), costs=('time', 'peak_memory')):
+    """
+    Returns the lines of the Pareto tables of `results` (an output of `run`), one per dimension,
+    duration, error and cost. The error of K_c only depends on the cumulants, so its cost is the time of `fit`,
+    averaged over the solvers run on the same cumulants (with the largest peak memory).
+    """
+    rows = [r for r in results['results'] if 'error' not in r]
+    lines = []
+    for d, T in sorted(set((r['case']['d'], r['case']['T']) for r in rows)):
+        rows_T = [r for r in rows if (r['case']['d'], r['case']['T']) == (d, T)]
+        for error, cost in product(errors, costs):
+            if error != 'err_G' and cost == 'time':
+                cost = 'fit_time'
+            candidates = rows_T
+            names = ['half_width', 'filtr', 'method', 'solver']
+            if error != 'err_G':
+                # one row per configuration of the cumulants
+                names = names[:-1]
+                groups = {}
+                for r in rows_T:
+                    groups.setdefault(tuple(r['case'][n] for n in names), []).append(r)
+                candidates = [dict(case=group[0]['case'], peak_memory=max(r['peak_memory'] for r in group),
+                                   **dict((m, sum(r[m] for r in group) / len(group)) for m in ERRORS + ['fit_time']))
+                              for group in groups.values()]
+            lines.append("")
+            lines.append("d=%d T=%g: %s versus %s" % (d, T, error, cost))
+            for r in pareto_front(candidates, cost, error):
+                value = r[cost] / 2. ** 20 if cost == 'peak_memory' else r[cost]
+                lines.append("  %-72s %12.3g %12.3g" % (" ".join("%s=%s" % (n, r['case'][n]) for n in names),
+                                                        value, r[error]))
+    return lines
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--d', nargs='+', type=int, default=[4])
+    parser.add_argument('--T', nargs='+', type=float, default=[1e3, 1e4, 1e5])
+    parser.add_argument('--half-width', nargs='+', type=float, default=[5., 10., 20.])
+    parser.add_argument('--filtr', nargs='+', choices=['rectangular', 'gaussian'], default=['rectangular', 'gaussian'])
+    parser.add_argument('--method', nargs='+', default=['parallel_by_day', 'partial_sums'])
+    parser.add_argument('--solver', nargs='+', choices=sorted(SOLVERS), default=['lbfgs', 'newton', 'fista_approximate'])
+    parser.add_argument('--seeds', type=int, default=3)
+    parser.add_argument('--timeout', type=float, default=3600.)
+    parser.add_argument('--output', help='JSON file to save the results to')
+    parser.add_argument('--case', help=argparse.SUPPRESS)
+    parser.add_argument('--seed', type=int, default=0, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.case is not None:
+        print(json.dumps(run_case(json.loads(args.case), args.seed)))
+        sys.exit(0)
+
+    grid = dict(d=args.d, T=args.T, half_width=args.half_width, filtr=args.filtr, method=args.method,
+                solver=args.solver)
+    results = run(grid, args.seeds, args.timeout)
+    print("\n".join(pareto_tables(results)))
+    if args.output is not None:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=1)
@@ -0,0 +1,53 @@
+"""
+Measures the time to import the modules of nphc in a fresh interpreter, and checks that the heavy
+optional dependencies (the solver backends) are not loaded by the import.
+
+Exits with status 1 if the best time over the runs exceeds the budget, or if a lazy module was loaded.
+
+Usage: python benchmarks/import_time.py [--budget 1.0] [--runs 5]
+"""
+import argparse
+import json
+import subprocess
+import sys
+
+
+MODULES = ['nphc.main', 'nphc.cumulants', 'nphc.accumulator']
+LAZY_MODULES = ['tensorflow', 'scipy.stats', 'joblib']
+
+SNIPPET = """
+import json, sys, time
+start = time.time()
+for module in %r:
+    __import__(module)
+elapsed = time.time() - start
+print(json.dumps({'time': elapsed, 'loaded': [m for m in %r if m in sys.modules]}))
+"""
+
+
+def measure(runs=5):
+    """
+    Returns the best import time over `runs` fresh interpreters, and the lazy modules that were loaded.
+    """
+    times = []
+    loaded = set()
+    for _ in range(runs):
+        out = subprocess.check_output([sys.executable, '-c', SNIPPET % (MODULES, LAZY_MODULES)])
+        res = json.loads(out.decode().strip().splitlines()[-1])
+        times.append(res['time'])
+        loaded.update(res['loaded'])
+    return min(times), sorted(loaded)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--budget', type=float, default=1.0, help='maximum import time in seconds')
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args()
+
+    best, loaded = measure(args.runs)
+    print("import of %s: %.3f s (budget %.3f s)" % (", ".join(MODULES), best, args.budget))
+    if loaded:
+        print("modules which should be imported lazily: %s" % ", ".join(loaded))
+    if best > args.budget or loaded:
+        sys.exit(1)
@@ -0,0 +1,296 @@
+"""
+Benchmarks of the cumulant kernels, of `Cumulants.compute_cumulants`, of `Cumulants.rolling` and of
+`NPHC.solve` on deterministic synthetic Poisson and Hawkes processes, over a grid of dimensions, numbers
+of events per component, half widths, filters and methods.
+
+Every case runs in a fresh interpreter: the kernels are compiled on a small slice of the data first,
+then the best wall time over `--repeat` runs is kept, with the throughput in events per second and the
+peak resident memory of the process. Cases whose runtime estimated by `nphc.planner` exceeds `--max-time`
+are skipped.
+
+The results are saved as JSON with `--output`, and compared with a previous run with `--baseline`:
+exits with status 1 if a case got slower than the baseline by more than `--tolerance`.
+
+Usage: python benchmarks/suite.py [--preset quick|full] [--d 2 10] [--n 1e4] [--half-width 10]
+                                  [--filtr rectangular] [--method classic partial_sums] [--process poisson]
+                                  [--output results.json] [--baseline baseline.json] [--tolerance 0.2]
+"""
+from itertools import product
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+PRESETS = {
+    'quick': dict(kinds=['kernel', 'cumulants', 'rolling', 'solve'], d=[2, 10], n=[1e4], half_width=[10.],
+                  filtr=['rectangular'], method=['classic', 'parallel_by_day', 'partial_sums'],
+                  process=['poisson', 'hawkes'], solver=['lbfgs', 'newton']),
+    'full': dict(kinds=['kernel', 'cumulants', 'rolling', 'solve'], d=[2, 10, 100, 500], n=[1e3, 1e5, 1e7],
+                 half_width=[1., 10., 100.], filtr=['rectangular', 'gaussian'],
+                 method=['classic', 'parallel_by_day', 'parallel_by_component', 'partial_sums'],
+                 process=['poisson', 'hawkes'], solver=['lbfgs', 'fista', 'newton']),
+}
+
+KERNELS = ['A_and_I_ij_rect', 'E_ijk_rect']
+# the solvers are benchmarked on the cumulants of a Hawkes process of this many events per component
+SOLVE_N = 1e4
+# `Cumulants.rolling` runs on windows of ROLLING_WINDOW of the ROLLING_DAYS equal slices of a realization
+ROLLING_DAYS = 10
+ROLLING_WINDOW = 5
+
+
+def hawkes_params(d):
+    """
+    Parameters of a Hawkes process whose components have intensity 1: each component excites
+    itself and the next one, the norm of the kernels matrix is 1/2.
+    """
+    import numpy as np
+    Alpha = 0.3 * np.eye(d)
+    if d > 1:
+        Alpha += 0.2 * np.roll(np.eye(d), 1, axis=1)
+    else:
+        Alpha *= 5. / 3
+    Beta = np.ones((d, d))
+    mu = np.dot(np.eye(d) - Alpha, np.ones(d))
+    return mu, Alpha, Beta
+
+
+def synthetic_realization(process, d, n, seed=0):
+    """
+    Returns a realization of `d` components with about `n` events each, on [0, n].
+    """
+    from nphc.utils.simulate_data import simulate_poisson, simulate_hawkes_exp
+    import numpy as np
+    if process == 'poisson':
+        return simulate_poisson(np.ones(d), float(n), random_state=seed)
+    elif process == 'hawkes':
+        mu, Alpha, Beta = hawkes_params(d)
+        return simulate_hawkes_exp(mu, Alpha, Beta, float(n), random_state=seed)
+    raise ValueError("`process` should either equal `poisson` or `hawkes`.")
+
+
+def cases(grid):
+    """
+    Returns the list of cases (dicts of parameters) of a grid.
+    """
+    res = []
+    if 'kernel' in grid['kinds']:
+        for name, n, half_width in product(KERNELS, grid['n'], grid['half_width']):
+            res.append(dict(kind='kernel', name=name, process='poisson', d=2, n=n, half_width=half_width))
+    if 'cumulants' in grid['kinds']:
+        for process, d, n, half_width, filtr, method in product(grid['process'], grid['d'], grid['n'],
+                                                                grid['half_width'], grid['filtr'], grid['method']):
+            res.append(dict(kind='cumulants', process=process, d=d, n=n, half_width=half_width, filtr=filtr,
+                            method=method))
+    if 'rolling' in grid['kinds']:
+        for process, d, n, half_width, filtr in product(grid['process'], grid['d'], grid['n'], grid['half_width'],
+                                                        grid['filtr']):
+            res.append(dict(kind='rolling', process=process, d=d, n=n, half_width=half_width, filtr=filtr))
+    if 'solve' in grid['kinds']:
+        for d, solver in product(grid['d'], grid['solver']):
+            res.append(dict(kind='solve', process='hawkes', d=d, n=SOLVE_N, half_width=10., solver=solver))
+    return res
+
+
+def key(case):
+    return json.dumps(case, sort_keys=True)
+
+
+def estimated_runtime(case):
+    """
+    Runtime estimated by `nphc.planner` from the sizes of the case, before simulating anything.
+    """
+    import numpy as np
+    from nphc import planner
+    counts = np.full((1, case['d']), float(case['n']))
+    durations = np.array([float(case['n'])])
+    if case['kind'] == 'cumulants':
+        return planner.estimate(case['method'], counts, durations, case['half_width'], case['filtr'])[1]
+    if case['kind'] == 'rolling':
+        return planner.estimate('partial_sums', counts, durations, case['half_width'], case['filtr'])[1]
+    return planner.estimate('classic', counts, durations, case['half_width'])[1]
+
+
+def peak_memory():
+    """
+    Peak resident memory of this process and of its terminated children, in bytes.
+    """
+    import resource
+    scale = 1 if sys.platform == 'darwin' else 1024
+    return (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale,
+            resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * scale)
+
+
+def best_time(fun, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.time()
+        out = fun()
+        times.append(time.time() - start)
+    return min(times), out
+
+
+def run_case(case, repeat=3):
+    """
+    Runs one case in this interpreter and returns its measures.
+    """
+    import numpy as np
+    realization = synthetic_realization(case['process'], case['d'], case['n'])
+    n_events = sum(len(x) for x in realization)
+    res = dict(n_events=n_events)
+    if case['kind'] == 'kernel':
+        from nphc import cumulants
+        x_i, x_j = realization
+        T = float(case['n'])
+        L = [len(x) / T for x in realization]
+        H = case['half_width']
+        if case['name'] == 'A_and_I_ij_rect':
+            fun = lambda x, y: cumulants.A_and_I_ij_rect(x, y, H, T, L[1])
+        else:
+            fun = lambda x, y: cumulants.E_ijk_rect(x, y, y, -H, H, T, L[0], L[1], 0.)
+        fun(x_i[:1000], x_j[:1000])
+        res['time'], _ = best_time(lambda: fun(x_i, x_j), repeat)
+    elif case['kind'] == 'cumulants':
+        from nphc.cumulants import Cumulants
+        args = dict(half_width=case['half_width'], method=case['method'], filtr=case['filtr'], verbose=False)
+        Cumulants([[x[:1000] for x in realization]]).compute_cumulants(**args)
+        res['time'], _ = best_time(lambda: Cumulants([realization]).compute_cumulants(**args), repeat)
+    elif case['kind'] == 'rolling':
+        # a fresh Cumulants every time: rolling computes the partial sums itself
+        from nphc.cumulants import Cumulants
+        edges = np.linspace(0., float(case['n']), ROLLING_DAYS + 1)
+        days = [[x[(x >= t0) & (x < t1)] for x in realization] for t0, t1 in zip(edges[:-1], edges[1:])]
+        args = dict(half_width=case['half_width'], filtr=case['filtr'])
+        Cumulants([[x[:100] for x in day] for day in days]).rolling(ROLLING_WINDOW, **args)
+        res['time'], _ = best_time(lambda: Cumulants(days).rolling(ROLLING_WINDOW, **args), repeat)
+    elif case['kind'] == 'solve':
+        from nphc.main import NPHC
+        nphc = NPHC()
+        nphc.fit([realization], half_width=case['half_width'], method='partial_sums', verbose=False)
+        nphc.solve(backend='numpy', solver=case['solver'], training_epochs=2)
+        res['time'], _ = best_time(lambda: nphc.solve(backend='numpy', solver=case['solver'],
+                                                      training_epochs=1000, display_step=10 ** 9), repeat)
+        res['cost'] = float(nphc.optcost)
+    else:
+        raise ValueError("Unknown kind of case %s." % case['kind'])
+    res['events_per_second'] = n_events / res['time']
+    res['peak_memory'], res['peak_memory_children'] = peak_memory()
+    return res
+
+
+def run_in_subprocess(case, repeat, timeout):
+    """
+    Runs one case in a fresh interpreter, so that compilations and peak memories are not shared.
+    """
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join([ROOT, os.environ.get('PYTHONPATH', '')]))
+    try:
+        out = subprocess.check_output([sys.executable, os.path.abspath(__file__), '--case', key(case),
+                                       '--repeat', str(repeat)], timeout=timeout, env=env,
+                                      stderr=subprocess.DEVNULL)
+    except subprocess.TimeoutExpired:
+        return dict(error='timeout')
+    except subprocess.CalledProcessError as e:
+        return dict(error='exit status %d' % e.returncode)
+    return json.loads(out.decode().strip().splitlines()[-1])
+
+
+def machine():
+    import numpy
+    import numba
+    return dict(platform=platform.platform(), processor=platform.processor(), cpu_count=os.cpu_count(),
+                python=platform.python_version(), numpy=numpy.__version__, numba=numba.__version__)
+
+
+def compare(results, baseline, tolerance=0.2):
+    """
+    Returns the lines of the comparison of `results` with `baseline` (both outputs of `run`),
+    and the number of cases slower than the baseline by more than `tolerance`.
+    """
+    reference = dict((key(r['case']), r) for r in baseline['results'] if 'time' in r)
+    lines = []
+    n_regressions = 0
+    for r in results['results']:
+        ref = reference.get(key(r['case']))
+        if ref is None or 'time' not in r:
+            continue
+        ratio = r['time'] / ref['time']
+        flag = ""
+        if ratio > 1 + tolerance:
+            flag = "  REGRESSION"
+            n_regressions += 1
+        elif ratio < 1 / (1 + tolerance):
+            flag = "  faster"
+        lines.append("%-88s %10.3g %10.3g %7.2fx%s" % (describe(r['case']), ref['time'], r['time'], ratio, flag))
+    return lines, n_regressions
+
+
+def describe(case):
+    return case['kind'] + " " + " ".join("%s=%s" % (k, case[k]) for k in sorted(case) if k != 'kind')
+
+
+def run(grid, repeat=3, max_time=600., timeout=3600.):
+    results = []
+    for case in cases(grid):
+        if estimated_runtime(case) > max_time:
+            res = dict(skipped='estimated runtime above %g s' % max_time)
+        else:
+            res = run_in_subprocess(case, repeat, timeout)
+        res['case'] = case
+        results.append(res)
+        if 'time' in res:
+            print("%-88s %10.3g s %12.3g ev/s %10.1f MB" % (describe(case), res['time'], res['events_per_second'],
+                                                             res['peak_memory'] / 2. ** 20))
+        else:
+            print("%-88s %s" % (describe(case), res.get('error') or res.get('skipped')))
+        sys.stdout.flush()
+    return dict(machine=machine(), date=time.strftime('%Y-%m-%d %H:%M:%S'), results=results)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--preset', choices=sorted(PRESETS), default='quick')
+    parser.add_argument('--kinds', nargs='+', choices=['kernel', 'cumulants', 'rolling', 'solve'])
+    parser.add_argument('--d', nargs='+', type=int)
+    parser.add_argument('--n', nargs='+', type=float, help='events per component')
+    parser.add_argument('--half-width', nargs='+', type=float)
+    parser.add_argument('--filtr', nargs='+', choices=['rectangular', 'gaussian'])
+    parser.add_argument('--method', nargs='+')
+    parser.add_argument('--process', nargs='+', choices=['poisson', 'hawkes'])
+    parser.add_argument('--solver', nargs='+')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--max-time', type=float, default=600., help='skip the cases estimated to be longer')
+    parser.add_argument('--timeout', type=float, default=3600.)
+    parser.add_argument('--output', help='JSON file to save the results to')
+    parser.add_argument('--baseline', help='JSON file of a previous run to compare with')
+    parser.add_argument('--tolerance', type=float, default=0.2)
+    parser.add_argument('--case', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.case is not None:
+        print(json.dumps(run_case(json.loads(args.case), args.repeat)))
+        sys.exit(0)
+
+    grid = dict(PRESETS[args.preset])
+    for name in ['kinds', 'd', 'n', 'half_width', 'filtr', 'method', 'process', 'solver']:
+        if getattr(args, name) is not None:
+            grid[name] = getattr(args, name)
+    results = run(grid, args.repeat, args.max_time, args.timeout)
+    if args.output is not None:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=1)
+    if args.baseline is not None:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        lines, n_regressions = compare(results, baseline, args.tolerance)
+        print("%-88s %10s %10s %8s" % ("case", "baseline", "time", "ratio"))
+        print("\n".join(lines))
+        if n_regressions > 0:
+            print("%d case(s) slower than the baseline by more than %d%%" % (n_regressions, 100 * args.tolerance))
+            sys.exit(1)
@@ -0,0 +1,525 @@
+from nphc.cumulants import window_stats_rect, window_stats_gauss, get_K_c, gauss_cdf
+from math import sqrt, pi
+import numpy as np
+import io
+
+
+def filter_widths(half_width, filtr='rectangular', sigma=1.0):
+    """
+    Returns the integrals of the filters used for C and J, that is the quantities that are
+    multiplied by \Lambda^j to center the window statistics, and the support of the J filter.
+    """
+    if filtr == "rectangular":
+        width = 2 * half_width
+        return width, width ** 2, width
+    elif filtr == "gaussian":
+        width_C = sigma * sqrt(2 * pi) * (gauss_cdf(half_width/sigma) - gauss_cdf(-half_width/sigma))
+        width_J = sigma**2 * 2 * pi * (gauss_cdf(half_width/(sqrt(2)*sigma)) - gauss_cdf(-half_width/(sqrt(2)*sigma)))
+        return width_C, width_J, sqrt(2) * half_width
+    else:
+        raise ValueError("`filtr` should either equal `rectangular` or `gaussian`.")
+
+
+def observation_window(realization):
+    start = min(x[0] for x in realization if len(x) > 0)
+    end = max(x[-1] for x in realization if len(x) > 0)
+    return float(start), float(end)
+
+
+class CumulantsAccumulator(object):
+    """
+    Uncentered sums over trigger events from which L, C, J and E_c can be computed.
+    Unlike the cumulants themselves, those sums are additive: accumulators computed on separate
+    days (or separate machines) can be merged, and the cumulants are only computed at the end.
+
+    A trigger event \tau of N^k is kept if the window [\tau - w, \tau + w] lies inside the
+    observation window of its realization, w being the support of the J filter.
+
+
+    Attributes
+    ----------
+
+        time : `float`
+            Total duration of the observation windows
+
+        N : `np.array` shape=(dim,)
+            Number of jumps of each component
+
+        n_trig : `np.array` shape=(dim,)
+            Number of trigger events kept for each component
+
+        S_C, S_J : `np.array` shape=(dim,dim)
+            S_C[k, j] is the sum over trigger events of N^k of the filtered number of jumps of N^j,
+            S_J[k, j] the sum of the filtered contributions to J
+
+        S_CC : `np.array` shape=(dim,dim)
+            S_CC[k, j] is the sum over trigger events of N^k of the products of the filtered
+            numbers of jumps of N^j and N^k
+
+        S_C2 : `np.array` shape=(dim,dim)
+            S_C2[k, j] is the sum over trigger events of N^k of the squared filtered number of jumps of N^j
+
+        S_M : `np.array` shape=(dim,dim,dim) or `None`
+            S_M[k, i, j] is the sum over trigger events of N^k of the products of the filtered numbers
+            of jumps of N^i and N^j. Only stored if `full_moments` is True, it is needed to aggregate nodes.
+    """
+
+    def __init__(self, dim, half_width=100., filtr='rectangular', sigma=1.0, full_moments=False):
+        filter_widths(half_width, filtr, sigma)
+        self.dim = dim
+        self.half_width = float(half_width)
+        self.filtr = filtr
+        self.sigma = float(sigma)
+        self.time = 0.
+        self.N = np.zeros(dim)
+        self.n_trig = np.zeros(dim)
+        self.S_C = np.zeros((dim, dim))
+        self.S_J = np.zeros((dim, dim))
+        self.S_CC = np.zeros((dim, dim))
+        self.S_C2 = np.zeros((dim, dim))
+        if full_moments:
+            self.S_M = np.zeros((dim, dim, dim))
+        else:
+            self.S_M = None
+
+    @property
+    def full_moments(self):
+        return self.S_M is not None
+
+    @property
+    def _fields(self):
+        fields = ('N', 'n_trig', 'S_C', 'S_J', 'S_CC', 'S_C2')
+        if self.full_moments:
+            fields += ('S_M',)
+        return fields
+
+    def copy(self):
+        res = CumulantsAccumulator(self.dim, self.half_width, self.filtr, self.sigma, self.full_moments)
+        res.time = self.time
+        for name in self._fields:
+            setattr(res, name, getattr(self, name).copy())
+        return res
+
+    def _check_compatible(self, other):
+        if not isinstance(other, CumulantsAccumulator):
+            raise TypeError("Only `CumulantsAccumulator` objects can be merged together.")
+        if (self.dim, self.half_width, self.filtr, self.sigma, self.full_moments) != \
+                (other.dim, other.half_width, other.filtr, other.sigma, other.full_moments):
+            raise ValueError("The accumulators should share the same `dim`, `half_width`, `filtr`, `sigma` and `full_moments`.")
+
+    def merge(self, other):
+        """
+        Returns a new accumulator holding the sums of both accumulators.
+        """
+        self._check_compatible(other)
+        res = self.copy()
+        res.time += other.time
+        for name in self._fields:
+            getattr(res, name)[...] += getattr(other, name)
+        return res
+
+    __add__ = merge
+
+    def subtract(self, other):
+        """
+        Returns a new accumulator where the sums of `other` are removed, `other` being
+        one of the accumulators merged in this one.
+        """
+        self._check_compatible(other)
+        res = self.copy()
+        res.time -= other.time
+        for name in self._fields:
+            getattr(res, name)[...] -= getattr(other, name)
+        return res
+
+    __sub__ = subtract
+
+    def __radd__(self, other):
+        # makes `sum(list_of_accumulators)` work
+        if other == 0:
+            return self
+        return self.merge(other)
+
+    def add_day(self, realization, chunk_size=65536):
+        """
+        Adds the contribution of one realization, given as a list of np.arrays
+        of time stamps (one per component).
+        """
+        d = self.dim
+        assert len(realization) == d, "The realization should have `dim` components."
+        realization = [np.asarray(x, dtype=np.float64) for x in realization]
+        if all(len(x) == 0 for x in realization):
+            return self
+        start, end = observation_window(realization)
+
+        self.time += end - start
+        for k in range(d):
+            self.N[k] += len(realization[k])
+            taus = self.trigger_events(realization[k], start, end)
+            self.n_trig[k] += len(taus)
+            for ix in range(0, len(taus), chunk_size):
+                counts, sums_J = self.window_stats(taus[ix:ix+chunk_size], realization)
+                self._add_trigger_stats(k, counts, sums_J)
+        return self
+
+    def trigger_events(self, realization_k, start, end):
+        """
+        Returns the jumps of N^k whose filter window lies inside [start, end].
+        """
+        margin = filter_widths(self.half_width, self.filtr, self.sigma)[2]
+        return realization_k[(realization_k >= start + margin) & (realization_k <= end - margin)]
+
+    def window_stats(self, taus, realization, components=None):
+        """
+        Returns two np.arrays shape=(len(taus), dim) holding, for each trigger time, the filtered
+        number of jumps of every component and the corresponding contributions to J.
+        If `components` is given, only those columns are computed.
+        """
+        if components is None:
+            components = range(self.dim)
+        counts = np.zeros((len(taus), len(components)))
+        sums_J = np.zeros((len(taus), len(components)))
+        for col, j in enumerate(components):
+            if self.filtr == "rectangular":
+                counts[:, col], sums_J[:, col] = window_stats_rect(taus, realization[j], self.half_width)
+            else:
+                counts[:, col], sums_J[:, col] = window_stats_gauss(taus, realization[j], self.half_width, self.sigma)
+        return counts, sums_J
+
+    def add_components(self, realization, chunk_size=65536):
+        """
+        Returns the accumulator of `realization`, whose first `dim` components are the ones this
+        accumulator was computed on (with `add_day`) and whose last components are new.
+        Only the statistics involving the new components are computed, the observation window
+        of the realization is kept unchanged.
+        """
+        if self.full_moments:
+            raise ValueError("Accumulators with `full_moments` can not be extended, compute them again.")
+        d_old = self.dim
+        d = len(realization)
+        assert d > d_old, "The realization should contain new components."
+        realization = [np.asarray(x, dtype=np.float64) for x in realization]
+        start, end = observation_window(realization[:d_old])
+        new = list(range(d_old, d))
+
+        res = CumulantsAccumulator(d, self.half_width, self.filtr, self.sigma)
+        res.time = self.time
+        for name in self._fields:
+            old = getattr(self, name)
+            getattr(res, name)[tuple(slice(0, d_old) for _ in old.shape)] = old
+        for k in range(d_old):
+            taus = self.trigger_events(realization[k], start, end)
+            for ix in range(0, len(taus), chunk_size):
+                counts, sums_J = self.window_stats(taus[ix:ix+chunk_size], realization, [k] + new)
+                res.S_C[k, new] += counts[:, 1:].sum(axis=0)
+                res.S_J[k, new] += sums_J[:, 1:].sum(axis=0)
+                res.S_CC[k, new] += np.dot(counts[:, 0], counts[:, 1:])
+                res.S_C2[k, new] += (counts[:, 1:] ** 2).sum(axis=0)
+        for k in new:
+            res.N[k] = len(realization[k])
+            taus = res.trigger_events(realization[k], start, end)
+            res.n_trig[k] = len(taus)
+            for ix in range(0, len(taus), chunk_size):
+                counts, sums_J = res.window_stats(taus[ix:ix+chunk_size], realization)
+                res._add_trigger_stats(k, counts, sums_J)
+        return res
+
+    def _add_trigger_stats(self, k, counts, sums_J):
+        self.S_C[k] += counts.sum(axis=0)
+        self.S_J[k] += sums_J.sum(axis=0)
+        self.S_CC[k] += np.dot(counts[:, k], counts)
+        self.S_C2[k] += (counts ** 2).sum(axis=0)
+        if self.full_moments:
+            self.S_M[k] += np.dot(counts.T, counts)
+
+    def select(self, nodes):
+        """
+        Returns the accumulator of the sub-process made of the components in `nodes`.
+        """
+        nodes = np.asarray(nodes, dtype=int)
+        res = CumulantsAccumulator(len(nodes), self.half_width, self.filtr, self.sigma, self.full_moments)
+        res.time = self.time
+        res.N = self.N[nodes]
+        res.n_trig = self.n_trig[nodes]
+        for name in ('S_C', 'S_J', 'S_CC', 'S_C2'):
+            setattr(res, name, getattr(self, name)[np.ix_(nodes, nodes)])
+        if self.full_moments:
+            res.S_M = self.S_M[np.ix_(nodes, nodes, nodes)]
+        return res
+
+    def aggregate(self, partition):
+        """
+        Returns the accumulator of the process whose g-th component is the superposition
+        of the components listed in `partition[g]`. Components that are in no group are dropped.
+        Requires `full_moments`, unless every group is a single component.
+        """
+        partition = [list(group) for group in partition]
+        if all(len(group) == 1 for group in partition):
+            return self.select([group[0] for group in partition])
+        if not self.full_moments:
+            raise ValueError("Aggregating components requires an accumulator computed with `full_moments=True`.")
+        P = np.zeros((len(partition), self.dim))
+        for g, group in enumerate(partition):
+            P[g, group] = 1.
+        res = CumulantsAccumulator(len(partition), self.half_width, self.filtr, self.sigma, full_moments=True)
+        res.time = self.time
+        res.N = np.dot(P, self.N)
+        res.n_trig = np.dot(P, self.n_trig)
+        res.S_C = np.dot(P, np.dot(self.S_C, P.T))
+        res.S_J = np.dot(P, np.dot(self.S_J, P.T))
+        res.S_M = np.einsum('gk,ai,bj,kij->gab', P, P, P, self.S_M, optimize=True)
+        res.S_CC = np.einsum('gag->ga', res.S_M).copy()
+        res.S_C2 = np.einsum('gaa->ga', res.S_M).copy()
+        return res
+
+    def finalize(self):
+        """
+        Computes the cumulants from the sums.
+
+        Returns
+        -------
+
+            L : `np.array` shape=(dim,)
+
+            C : `np.array` shape=(dim,dim)
+
+            J : `np.array` shape=(dim,dim)
+
+            E_c : `np.array` shape=(dim,dim,2)
+
+            K_c : `np.array` shape=(dim,dim)
+        """
+        T = self.time
+        assert T > 0, "The accumulator is empty."
+        width_C, width_J, _ = filter_widths(self.half_width, self.filtr, self.sigma)
+        n = self.n_trig
+        L = self.N / T
+        trend_C = L * width_C
+        trend_J = L * width_J
+
+        C = (self.S_C - np.outer(n, trend_C)) / T
+        J = (self.S_J - np.outer(n, trend_J)) / T
+        # we keep the symmetric part to remove edge effects
+        C = 0.5 * (C + C.T)
+        J = 0.5 * (J + J.T)
+
+        E_c = np.zeros((self.dim, self.dim, 2))
+        # E_c[i, j, 0]: trigger events of N^j, product of the jumps of N^i and N^j
+        S_C_diag = np.diag(self.S_C)
+        E_c[:, :, 0] = self.S_CC.T - trend_C[None, :] * self.S_C.T - trend_C[:, None] * S_C_diag[None, :] \
+                       + n[None, :] * (np.outer(trend_C, trend_C) - J)
+        # E_c[i, j, 1]: trigger events of N^i, squared jumps of N^j
+        E_c[:, :, 1] = self.S_C2 - 2 * trend_C[None, :] * self.S_C \
+                       + n[:, None] * (trend_C ** 2 - np.diag(J))[None, :]
+        E_c /= T
+        K_c = get_K_c(E_c)
+        return L, C, J, E_c, K_c
+
+    def to_bytes(self):
+        """
+        Serializes the accumulator in a compressed `npz` archive.
+        """
+        buf = io.BytesIO()
+        arrays = {name: getattr(self, name) for name in self._fields}
+        np.savez_compressed(buf, header=np.array([self.dim, self.half_width, self.time, self.sigma]),
+                            filtr=np.array(self.filtr), **arrays)
+        return buf.getvalue()
+
+    @classmethod
+    def from_bytes(cls, data):
+        archive = np.load(io.BytesIO(data))
+        dim, half_width, time, sigma = archive['header']
+        res = cls(int(dim), half_width, str(archive['filtr']), sigma, full_moments='S_M' in archive.files)
+        res.time = float(time)
+        for name in res._fields:
+            setattr(res, name, archive[name])
+        return res
+
+    def save(self, filename):
+        with open(filename, 'wb') as f:
+            f.write(self.to_bytes())
+
+    @classmethod
+    def load(cls, filename):
+        with open(filename, 'rb') as f:
+            return cls.from_bytes(f.read())
+
+
+def worker_day_accumulator(realization, half_width, filtr, sigma, full_moments=False):
+    return CumulantsAccumulator(len(realization), half_width, filtr, sigma, full_moments).add_day(realization)
+
+
+def worker_day_grid_accumulators(realization, grid, filtr, sigmas, full_moments=False):
+    """
+    Returns the accumulators of one realization for each half width of `grid` (with the filter widths
+    `sigmas`), in a single job so that the realization is sent to a worker once for the whole grid.
+    """
+    return [worker_day_accumulator(realization, half_width, filtr, sigma, full_moments)
+            for half_width, sigma in zip(grid, sigmas)]
+
+
+def accumulate(realizations, half_width=100., filtr='rectangular', sigma=1.0, full_moments=False, n_jobs=-1):
+    """
+    Computes one accumulator per realization, in parallel over the realizations.
+    Merge the output with `merge_accumulators` to get the sums over all realizations.
+    """
+    from joblib import Parallel, delayed
+    return Parallel(n_jobs)(delayed(worker_day_accumulator)(realization, half_width, filtr, sigma, full_moments)
+                            for realization in realizations)
+
+
+def merge_accumulators(accumulators):
+    accumulators = list(accumulators)
+    assert len(accumulators) > 0, "There should be at least one accumulator to merge."
+    res = accumulators[0].copy()
+    for acc in accumulators[1:]:
+        res = res.merge(acc)
+    return res
+
+
+def day_block_accumulators(realization, n_blocks, half_width=100., filtr='rectangular', sigma=1.0,
+                           full_moments=False, chunk_size=65536):
+    """
+    Returns the accumulators of `n_blocks` consecutive time blocks of equal duration of one realization,
+    computed in the same sweep as `CumulantsAccumulator.add_day`: each trigger event (and each jump
+    counted in N) is attributed to the block containing it, its window may extend over the neighbouring
+    blocks. The merge of the blocks is the accumulator of the whole realization.
+    """
+    d = len(realization)
+    realization = [np.asarray(x, dtype=np.float64) for x in realization]
+    blocks = [CumulantsAccumulator(d, half_width, filtr, sigma, full_moments) for _ in range(n_blocks)]
+    if all(len(x) == 0 for x in realization):
+        return blocks
+    start, end = observation_window(realization)
+    edges = np.linspace(start, end, n_blocks + 1)
+    for b, acc in enumerate(blocks):
+        acc.time = edges[b + 1] - edges[b]
+    template = blocks[0]
+    for k in range(d):
+        bounds = np.concatenate(([0], np.searchsorted(realization[k], edges[1:-1]), [len(realization[k])]))
+        for b, acc in enumerate(blocks):
+            acc.N[k] += bounds[b + 1] - bounds[b]
+        taus = template.trigger_events(realization[k], start, end)
+        bounds = np.concatenate(([0], np.searchsorted(taus, edges[1:-1]), [len(taus)]))
+        for ix in range(0, len(taus), chunk_size):
+            counts, sums_J = template.window_stats(taus[ix:ix+chunk_size], realization)
+            for b, acc in enumerate(blocks):
+                lo = max(bounds[b], ix) - ix
+                hi = min(bounds[b + 1], ix + chunk_size) - ix
+                if hi > lo:
+                    acc.n_trig[k] += hi - lo
+                    acc._add_trigger_stats(k, counts[lo:hi], sums_J[lo:hi])
+    return blocks
+
+
+def jackknife_variance(accumulators):
+    """
+    Block jackknife estimates of the variances of the entries of L, C and K_c computed from the merge
+    of `accumulators` (the blocks of `day_block_accumulators`, or the accumulators of several
+    realizations). With theta_b the estimate computed without the b-th of the B accumulators,
+    var = (B - 1) / B * sum_b (theta_b - mean(theta))^2.
+
+    Returns
+    -------
+
+        var_L : `np.array` shape=(dim,)
+
+        var_C : `np.array` shape=(dim,dim)
+
+        var_K_c : `np.array` shape=(dim,dim)
+    """
+    accumulators = list(accumulators)
+    B = len(accumulators)
+    assert B > 1, "The jackknife needs at least two accumulators."
+    total = merge_accumulators(accumulators)
+    estimates = [(total - acc).finalize() for acc in accumulators]
+    res = []
+    for ix in (0, 1, 4):
+        theta = np.array([est[ix] for est in estimates])
+        res.append((B - 1.) / B * np.sum((theta - theta.mean(axis=0)) ** 2, axis=0))
+    return tuple(res)
+
+
+def worker_day_blocks(realization, n_blocks, half_width, filtr, sigma, full_moments=False):
+    """
+    Returns the accumulator of the realization and the jackknife variances of its cumulants
+    over `n_blocks` time blocks.
+    """
+    blocks = day_block_accumulators(realization, n_blocks, half_width, filtr, sigma, full_moments)
+    return merge_accumulators(blocks), jackknife_variance(blocks)
+
+
+class TimeRangeIndex(object):
+    """
+    Prefix sums of the per trigger event statistics of a list of realizations.
+    Once built, the accumulator (hence the cumulants) restricted to any time range [t0, t1)
+    and any subset of realizations is obtained with binary searches, in a time that does not
+    depend on the number of events.
+
+    The trigger events are selected by the range, their windows may overlap its bounds.
+    The index holds 4 * dim floats per jump: for large datasets, build it on the periods
+    you want to explore.
+    """
+
+    def __init__(self, realizations=[], half_width=100., filtr='rectangular', sigma=1.0, chunk_size=65536):
+        if all(isinstance(x, list) for x in realizations):
+            self.realizations = realizations
+        else:
+            self.realizations = [realizations]
+        self.dim = len(self.realizations[0])
+        self.n_realizations = len(self.realizations)
+        self._template = CumulantsAccumulator(self.dim, half_width, filtr, sigma)
+        self.windows = np.zeros((self.n_realizations, 2))
+        # one list per realization, holding for each component a tuple
+        # (times, trigger times, prefix sums of the trigger statistics)
+        self._days = []
+        d = self.dim
+        fields = ('S_C', 'S_J', 'S_CC', 'S_C2')
+        for day, realization in enumerate(self.realizations):
+            realization = [np.asarray(x, dtype=np.float64) for x in realization]
+            start, end = observation_window(realization)
+            self.windows[day] = start, end
+            components = []
+            for k in range(d):
+                taus = self._template.trigger_events(realization[k], start, end)
+                prefix = {name: np.zeros((len(taus) + 1, d)) for name in fields}
+                for ix in range(0, len(taus), chunk_size):
+                    counts, sums_J = self._template.window_stats(taus[ix:ix+chunk_size], realization)
+                    sl = slice(ix + 1, ix + 1 + len(counts))
+                    prefix['S_C'][sl] = counts
+                    prefix['S_J'][sl] = sums_J
+                    prefix['S_CC'][sl] = counts * counts[:, k:k+1]
+                    prefix['S_C2'][sl] = counts ** 2
+                for name in fields:
+                    np.cumsum(prefix[name], axis=0, out=prefix[name])
+                components.append((realization[k], taus, prefix))
+            self._days.append(components)
+
+    def accumulator(self, t0=-np.inf, t1=np.inf, days=None):
+        """
+        Returns the `CumulantsAccumulator` of the trigger events lying in [t0, t1),
+        the range being applied to each realization in `days` (all realizations by default).
+        """
+        if days is None:
+            days = range(self.n_realizations)
+        res = self._template.copy()
+        for day in days:
+            start, end = self.windows[day]
+            res.time += max(0., min(t1, end) - max(t0, start))
+            for k, (times, taus, prefix) in enumerate(self._days[day]):
+                a, b = np.searchsorted(times, [t0, t1])
+                res.N[k] += b - a
+                a, b = np.searchsorted(taus, [t0, t1])
+                res.n_trig[k] += b - a
+                res.S_C[k] += prefix['S_C'][b] - prefix['S_C'][a]
+                res.S_J[k] += prefix['S_J'][b] - prefix['S_J'][a]
+                res.S_CC[k] += prefix['S_CC'][b] - prefix['S_CC'][a]
+                res.S_C2[k] += prefix['S_C2'][b] - prefix['S_C2'][a]
+        return res
+
+    def cumulants(self, t0=-np.inf, t1=np.inf, days=None):
+        """
+        Returns L, C, J, E_c and K_c computed on [t0, t1) over the realizations in `days`,
+        see `CumulantsAccumulator.finalize`.
+        """
+        return self.accumulator(t0, t1, days).finalize()
@@ -0,0 +1,43 @@
+"""
+Registry of the backends of `NPHC.solve`. A backend is a function
+    solve(L, C, K_c, starts, alpha, **options) -> (R, cost, start_costs, trace)
+which minimizes the objective from each starting point in `starts`, with the stacked cumulants of the
+realizations, and the options of `NPHC.solve` as keyword arguments (a backend ignores the ones it does
+not use). It returns the best solution, its cost, the cost reached from each start, and the structured
+array of `nphc.solvers.SolverTrace` or None.
+
+The backends are registered by name, either as functions or as 'module:function' paths which are only
+imported on first use, so that importing nphc does not load TensorFlow.
+"""
+import importlib
+
+
+_backends = {
+    'numpy': 'nphc.solvers:solve_numpy',
+    'tensorflow': 'nphc.tf_solver:solve_tensorflow',
+}
+
+
+def register_backend(name, backend):
+    """
+    Registers `backend`, a function or a 'module:function' path, under `name`.
+    """
+    _backends[name] = backend
+
+
+def available_backends():
+    return sorted(_backends)
+
+
+def get_backend(name):
+    """
+    Returns the backend registered under `name`, importing it if needed.
+    """
+    if name not in _backends:
+        raise ValueError("In `solve`: `backend` should be one of %s." % ", ".join(available_backends()))
+    backend = _backends[name]
+    if isinstance(backend, str):
+        module, function = backend.split(':')
+        backend = getattr(importlib.import_module(module), function)
+        _backends[name] = backend
+    return backend
@@ -1,10 +1,9 @@
 from numba import autojit, jit, double, int32, int64, float64
 from scipy.linalg import inv, pinv, eigh
-from joblib import Parallel, delayed
-from math import sqrt, pi, exp
-from scipy.stats import norm
+from math import sqrt, pi, exp, erf
 from itertools import product
 import numpy as np
+import time
 
 
 class Cumulants(object):
@@ -31,6 +30,16 @@ class Cumulants(object):
         self.R_true = None
         self.mu_true = None
         self.half_width = half_width
+        self.filtr = None
+        self.sigma = None
+        self.method = None
+        self.partial_sums = None
+        # variances of the entries of the cumulants, see `compute_partial_sums`
+        self.L_var = None
+        self.C_var = None
+        self.K_c_var = None
+        # `nphc.profiling.CumulantsProfile` of the last call to `compute_cumulants`, if any
+        self.profile = None
 
     # ###########
     # ## Decorator to compute the cumulants on each day, and average
@@ -94,7 +103,9 @@ class Cumulants(object):
     #         self.C[day] = C.copy()
 
 
-    def compute_C_and_J(self, half_width=0., method='parallel_by_day', filtr='rectangular', sigma=1.0):
+    def compute_C_and_J(self, half_width=0., method='parallel_by_day', filtr='rectangular', sigma=1.0, profile=None):
+        from joblib import Parallel, delayed
+        from nphc.profiling import timed
         if half_width == 0.:
             h_w = self.half_width
         else:
@@ -108,7 +119,15 @@ class Cumulants(object):
         else:
             raise ValueError("In `compute_C_and_J`: `filtr` should either equal `rectangular` or `gaussian`.")
 
-        if method == 'parallel_by_day':
+        if method == 'parallel_by_day' and profile is not None:
+            l = Parallel(-1)(delayed(timed)(worker_day_C_J, A_and_I_ij, realization, h_w, T, L, sigma, d, True) for (realization, T, L) in zip(self.realizations, self.time, self.L))
+            for day, ((_, times), elapsed) in enumerate(l):
+                self._profile_day(profile, 'C', day, elapsed, times, h_w, filtr)
+            l = [z for ((z, _), _) in l]
+            self.C = [0.5*(z.real+z.real.T) for z in l]
+            self._J = [0.5*(z.imag+z.imag.T) for z in l]
+
+        elif method == 'parallel_by_day':
             l = Parallel(-1)(delayed(worker_day_C_J)(A_and_I_ij, realization, h_w, T, L, sigma, d) for (realization, T, L) in zip(self.realizations, self.time, self.L))
             self.C = [0.5*(z.real+z.real.T) for z in l]
             self._J = [0.5*(z.imag+z.imag.T) for z in l]
@@ -116,9 +135,18 @@ class Cumulants(object):
         elif method == 'parallel_by_component':
             for day in range(len(self.realizations)):
                 realization = self.realizations[day]
-                l = Parallel(-1)(
-                        delayed(A_and_I_ij)(realization[i], realization[j], h_w, self.time[day], self.L[day][j], sigma)
-                        for i in range(d) for j in range(d))
+                if profile is not None:
+                    start = time.time()
+                    l = Parallel(-1)(
+                            delayed(timed)(A_and_I_ij, realization[i], realization[j], h_w, self.time[day], self.L[day][j], sigma)
+                            for i in range(d) for j in range(d))
+                    times = np.array([elapsed for (_, elapsed) in l]).reshape(d, d)
+                    self._profile_day(profile, 'C', day, time.time() - start, times, h_w, filtr)
+                    l = [z for (z, _) in l]
+                else:
+                    l = Parallel(-1)(
+                            delayed(A_and_I_ij)(realization[i], realization[j], h_w, self.time[day], self.L[day][j], sigma)
+                            for i in range(d) for j in range(d))
                 C_and_J = np.array(l).reshape(d, d)
                 C = C_and_J.real
                 J = C_and_J.imag
@@ -133,10 +161,18 @@ class Cumulants(object):
                 realization = self.realizations[day]
                 C = np.zeros((d,d))
                 J = np.zeros((d, d))
+                if profile is not None:
+                    start = time.time()
+                    times = np.zeros((d, d))
                 for i, j in product(range(d), repeat=2):
-                    z = A_and_I_ij(realization[i], realization[j], h_w, self.time[day], self.L[day][j], sigma)
+                    if profile is not None:
+                        z, times[i, j] = timed(A_and_I_ij, realization[i], realization[j], h_w, self.time[day], self.L[day][j], sigma)
+                    else:
+                        z = A_and_I_ij(realization[i], realization[j], h_w, self.time[day], self.L[day][j], sigma)
                     C[i,j] = z.real
                     J[i,j] = z.imag
+                if profile is not None:
+                    self._profile_day(profile, 'C', day, time.time() - start, times, h_w, filtr)
                 # we keep the symmetric part to remove edge effects
                 C[:] = 0.5 * (C + C.T)
                 J[:] = 0.5 * (J + J.T)
@@ -147,7 +183,9 @@ class Cumulants(object):
             raise ValueError("In `compute_C_and_J`: `method` should either equal `parallel_by_day`, `parallel_by_component` or `classic`.")
 
 
-    def compute_E_c(self, half_width=0., method='parallel_by_day', filtr='rectangular', sigma=1.0):
+    def compute_E_c(self, half_width=0., method='parallel_by_day', filtr='rectangular', sigma=1.0, profile=None):
+        from joblib import Parallel, delayed
+        from nphc.profiling import timed
         if half_width == 0.:
             h_w = self.half_width
         else:
@@ -161,19 +199,38 @@ class Cumulants(object):
         else:
             raise ValueError("In `compute_E_c`: `filtr` should either equal `rectangular` or `gaussian`.")
 
-        if method == 'parallel_by_day':
+        if method == 'parallel_by_day' and profile is not None:
+            l = Parallel(-1)(delayed(timed)(worker_day_E, E_ijk, realization, h_w, T, L, J, sigma, d, True) for (realization, T, L, J) in zip(self.realizations, self.time, self.L, self._J))
+            for day, ((_, times), elapsed) in enumerate(l):
+                self._profile_day(profile, 'K_c', day, elapsed, times, h_w, filtr)
+            self._E_c = [E_c for ((E_c, _), _) in l]
+
+        elif method == 'parallel_by_day':
             self._E_c = Parallel(-1)(delayed(worker_day_E)(E_ijk, realization, h_w, T, L, J, sigma, d) for (realization, T, L, J) in zip(self.realizations, self.time, self.L, self._J))
 
         elif method == 'parallel_by_component':
             for day in range(len(self.realizations)):
                 realization = self.realizations[day]
                 E_c = np.zeros((d, d, 2))
-                l1 = Parallel(-1)(
-                        delayed(E_ijk)(realization[i], realization[j], realization[j], -h_w, h_w,
-                                            self.time[day], self.L[day][i], self.L[day][j], self._J[day][i, j], sigma) for i in range(d) for j in range(d))
-                l2 = Parallel(-1)(
-                        delayed(E_ijk)(realization[j], realization[j], realization[i], -h_w, h_w,
-                                            self.time[day], self.L[day][j], self.L[day][j], self._J[day][j, j], sigma) for i in range(d) for j in range(d))
+                if profile is not None:
+                    start = time.time()
+                    l1 = Parallel(-1)(
+                            delayed(timed)(E_ijk, realization[i], realization[j], realization[j], -h_w, h_w,
+                                                self.time[day], self.L[day][i], self.L[day][j], self._J[day][i, j], sigma) for i in range(d) for j in range(d))
+                    l2 = Parallel(-1)(
+                            delayed(timed)(E_ijk, realization[j], realization[j], realization[i], -h_w, h_w,
+                                                self.time[day], self.L[day][j], self.L[day][j], self._J[day][j, j], sigma) for i in range(d) for j in range(d))
+                    times = np.array([t1 + t2 for ((_, t1), (_, t2)) in zip(l1, l2)]).reshape(d, d)
+                    self._profile_day(profile, 'K_c', day, time.time() - start, times, h_w, filtr)
+                    l1 = [z for (z, _) in l1]
+                    l2 = [z for (z, _) in l2]
+                else:
+                    l1 = Parallel(-1)(
+                            delayed(E_ijk)(realization[i], realization[j], realization[j], -h_w, h_w,
+                                                self.time[day], self.L[day][i], self.L[day][j], self._J[day][i, j], sigma) for i in range(d) for j in range(d))
+                    l2 = Parallel(-1)(
+                            delayed(E_ijk)(realization[j], realization[j], realization[i], -h_w, h_w,
+                                                self.time[day], self.L[day][j], self.L[day][j], self._J[day][j, j], sigma) for i in range(d) for j in range(d))
                 E_c[:, :, 0] = np.array(l1).reshape(d, d)
                 E_c[:, :, 1] = np.array(l2).reshape(d, d)
                 self._E_c[day] = E_c.copy()
@@ -182,18 +239,253 @@ class Cumulants(object):
             for day in range(len(self.realizations)):
                 realization = self.realizations[day]
                 E_c = np.zeros((d, d, 2))
+                if profile is not None:
+                    start = time.time()
+                    times = np.zeros((d, d))
                 for i in range(d):
                     for j in range(d):
+                        if profile is not None:
+                            pair_start = time.time()
                         E_c[i, j, 0] = E_ijk(realization[i], realization[j], realization[j], -h_w, h_w,
                                                   self.time[day], self.L[day][i], self.L[day][j], self._J[day][i, j], sigma)
                         E_c[i, j, 1] = E_ijk(realization[j], realization[j], realization[i], -h_w, h_w,
                                                   self.time[day], self.L[day][j], self.L[day][j], self._J[day][j, j], sigma)
+                        if profile is not None:
+                            times[i, j] = time.time() - pair_start
+                if profile is not None:
+                    self._profile_day(profile, 'K_c', day, time.time() - start, times, h_w, filtr)
                 self._E_c[day] = E_c.copy()
 
         else:
 
             raise ValueError("In `compute_E_c`: the filtering function should be either `rectangular` or `gaussian`.")
 
+    def compute_partial_sums(self, half_width=0., filtr='rectangular', sigma=1.0, full_moments=False, n_blocks=0,
+                             profile=None):
+        """
+        Computes one `CumulantsAccumulator` per realization, in parallel over the realizations,
+        and stores them in `self.partial_sums`. Use `full_moments=True` to be able to aggregate
+        components afterwards with `aggregate_nodes`.
+
+        If `n_blocks` > 1, each realization is swept once into `n_blocks` time blocks, and the block
+        jackknife variances of its cumulants are stored in `L_var`, `C_var` and `K_c_var`
+        (see `nphc.accumulator.jackknife_variance`).
+        """
+        from nphc.accumulator import accumulate, worker_day_accumulator, worker_day_blocks
+        from joblib import Parallel, delayed
+        if half_width == 0.:
+            h_w = self.half_width
+        else:
+            h_w = half_width
+        if n_blocks > 1:
+            worker, args = worker_day_blocks, (n_blocks, h_w, filtr, sigma, full_moments)
+        else:
+            worker, args = worker_day_accumulator, (h_w, filtr, sigma, full_moments)
+        if profile is not None:
+            from nphc.profiling import timed
+            l = Parallel(-1)(delayed(timed)(worker, realization, *args) for realization in self.realizations)
+            for day, (_, elapsed) in enumerate(l):
+                self._profile_day(profile, 'partial_sums', day, elapsed, None, h_w, filtr)
+            l = [res for (res, _) in l]
+        elif n_blocks > 1:
+            l = Parallel(-1)(delayed(worker)(realization, *args) for realization in self.realizations)
+        else:
+            l = accumulate(self.realizations, half_width=h_w, filtr=filtr, sigma=sigma, full_moments=full_moments)
+        if n_blocks > 1:
+            self.partial_sums = [acc for (acc, _) in l]
+            self.L_var = np.array([var[0] for (_, var) in l])
+            self.C_var = np.array([var[1] for (_, var) in l])
+            self.K_c_var = np.array([var[2] for (_, var) in l])
+        else:
+            self.partial_sums = l
+
+    def _profile_day(self, profile, stage, day, elapsed, times, h_w, filtr):
+        """
+        Records a realization in `profile`, and its pairs of components. `times` shape=(dim,dim) holds
+        the wall times of the pairs, or is None if they were not timed.
+        """
+        realization = self.realizations[day]
+        n_events = sum(len(x) for x in realization)
+        profile.record_day(stage, day, elapsed, n_events)
+        if times is None:
+            times = np.full((self.dim, self.dim), np.nan)
+        profile.record_pairs_of_day(stage, day, realization, times, h_w, filtr)
+
+    def set_from_partial_sums(self):
+        assert self.partial_sums is not None, "You should compute the partial sums first."
+        for day, acc in enumerate(self.partial_sums):
+            L, C, J, E_c, K_c = acc.finalize()
+            self.L[day] = L
+            self.C[day] = C
+            self._J[day] = J
+            self._E_c[day] = E_c
+            self.K_c[day] = K_c
+
+    def rolling(self, window, step=1, half_width=0., filtr=None, sigma=0.):
+        """
+        Computes the cumulants on sliding windows of `window` consecutive realizations, the
+        window moving by `step` realizations. The per realization partial sums are computed once
+        (if `compute_partial_sums` was not called before), then each window is obtained from the
+        previous one by adding the entering realizations and removing the leaving ones.
+
+        The settings left to their defaults are those of the stored partial sums, if any (otherwise
+        `self.half_width`, 'rectangular' and the `sigma` of `compute_cumulants`). Raises a ValueError
+        if a given setting differs from the one of the stored partial sums: call `compute_partial_sums`
+        with the new settings first.
+
+        Returns
+        -------
+
+            L : `np.array` shape=(n_windows,dim)
+
+            C : `np.array` shape=(n_windows,dim,dim)
+
+            K_c : `np.array` shape=(n_windows,dim,dim)
+
+        The w-th window covers the realizations w * step, ..., w * step + window - 1.
+        """
+        from nphc.accumulator import merge_accumulators
+        assert 0 < window <= self.n_realizations, "`window` should be between 1 and the number of realizations."
+        assert step > 0, "`step` should be positive."
+        if self.partial_sums is None:
+            if half_width == 0.: half_width = self.half_width
+            if filtr is None: filtr = 'rectangular'
+            if sigma == 0.: sigma = half_width / 5. if filtr == 'gaussian' else 1.0
+            self.compute_partial_sums(half_width=half_width, filtr=filtr, sigma=sigma)
+        else:
+            acc = self.partial_sums[0]
+            for name, value in [('half_width', half_width), ('filtr', filtr), ('sigma', sigma)]:
+                if value not in (0., None) and value != getattr(acc, name):
+                    raise ValueError("The partial sums were computed with `%s=%s`: call `compute_partial_sums` "
+                                     "to use `%s=%s`." % (name, getattr(acc, name), name, value))
+        starts = range(0, self.n_realizations - window + 1, step)
+        L = np.zeros((len(starts), self.dim))
+        C = np.zeros((len(starts), self.dim, self.dim))
+        K_c = np.zeros((len(starts), self.dim, self.dim))
+        acc = None
+        for w, start in enumerate(starts):
+            if acc is None or step >= window:
+                acc = merge_accumulators(self.partial_sums[start:start+window])
+            else:
+                for day in range(start - step, start):
+                    acc = acc - self.partial_sums[day]
+                for day in range(start + window - step, start + window):
+                    acc = acc + self.partial_sums[day]
+            L[w], C[w], _, _, K_c[w] = acc.finalize()
+        return L, C, K_c
+
+    def aggregate_nodes(self, partition):
+        """
+        Computes, from the stored partial sums, the cumulants of the process whose g-th component
+        is the superposition of the components listed in `partition[g]`. A list of single components,
+        like [[0], [3], [4]], selects a sub-process. No time stamp is read again.
+
+        Returns
+        -------
+
+            L : `np.array` shape=(n_realizations,n_groups)
+
+            C : `np.array` shape=(n_realizations,n_groups,n_groups)
+
+            K_c : `np.array` shape=(n_realizations,n_groups,n_groups)
+        """
+        assert self.partial_sums is not None, "You should compute the partial sums first."
+        n_groups = len(partition)
+        L = np.zeros((self.n_realizations, n_groups))
+        C = np.zeros((self.n_realizations, n_groups, n_groups))
+        K_c = np.zeros((self.n_realizations, n_groups, n_groups))
+        for day, acc in enumerate(self.partial_sums):
+            L[day], C[day], _, _, K_c[day] = acc.aggregate(partition).finalize()
+        return L, C, K_c
+
+    def add_components(self, new_processes):
+        """
+        Adds new components to the process and computes the cumulants involving them, with the
+        settings of the last call to `compute_cumulants`. The cumulants that were already computed
+        are kept: only O(d) pairs of components are processed, instead of O(d^2).
+
+        This only holds if the time stamps of the new components lie inside the observation window
+        of their realization: otherwise the durations change, and all the cumulants (and the stored
+        partial sums) are computed again. The stored partial sums with `full_moments` can not be
+        extended, they are always computed again. The variances `L_var`, `C_var` and `K_c_var`
+        are dropped.
+
+        Parameters
+        ----------
+
+            new_processes : `list`
+                * Either a list of np.arrays, the time stamps of the new components
+                (for a single realization)
+                * Or a list of such lists, one per realization.
+        """
+        assert self.method is not None, "You should compute the cumulants first."
+        from nphc.accumulator import observation_window
+        from joblib import Parallel, delayed
+        if all(isinstance(x, list) for x in new_processes):
+            new_realizations = new_processes
+        else:
+            new_realizations = [new_processes]
+        assert len(new_realizations) == self.n_realizations, "New components should be given for every realization."
+        d_old = self.dim
+        d = d_old + len(new_realizations[0])
+        windows = [observation_window(realization) for realization in self.realizations]
+        self.realizations = [list(realization) + list(new) for (realization, new) in zip(self.realizations, new_realizations)]
+        self.dim = d
+        self.L_var = self.C_var = self.K_c_var = None
+
+        if any(observation_window(realization) != window for (realization, window) in zip(self.realizations, windows)):
+            for day, realization in enumerate(self.realizations):
+                start, end = observation_window(realization)
+                self.time[day] = end - start
+            self.L = np.zeros((self.n_realizations, d))
+            self.C = np.zeros((self.n_realizations, d, d))
+            self._J = np.zeros((self.n_realizations, d, d))
+            self._E_c = np.zeros((self.n_realizations, d, d, 2))
+            self.K_c = np.zeros((self.n_realizations, d, d))
+            partial_sums = self.partial_sums
+            self.compute_cumulants(self.half_width, method=self.method, filtr=self.filtr, sigma=self.sigma)
+            if partial_sums is not None and (self.method != 'partial_sums' or partial_sums[0].full_moments):
+                acc = partial_sums[0]
+                self.compute_partial_sums(half_width=acc.half_width, filtr=acc.filtr, sigma=acc.sigma,
+                                          full_moments=acc.full_moments)
+            return
+
+        L = np.zeros((self.n_realizations, d))
+        L[:, :d_old] = self.L
+        for day, new in enumerate(new_realizations):
+            L[day, d_old:] = [len(x) / self.time[day] for x in new]
+        self.L = L
+
+        if self.partial_sums is not None:
+            acc = self.partial_sums[0]
+            if acc.full_moments:
+                self.compute_partial_sums(half_width=acc.half_width, filtr=acc.filtr, sigma=acc.sigma,
+                                          full_moments=True)
+            else:
+                self.partial_sums = Parallel(-1)(delayed(acc.add_components)(realization)
+                                                 for (acc, realization) in zip(self.partial_sums, self.realizations))
+
+        if self.method == 'partial_sums':
+            self.C = np.zeros((self.n_realizations, d, d))
+            self._J = np.zeros((self.n_realizations, d, d))
+            self._E_c = np.zeros((self.n_realizations, d, d, 2))
+            self.K_c = np.zeros((self.n_realizations, d, d))
+            self.set_from_partial_sums()
+            return
+
+        if self.filtr == "rectangular":
+            A_and_I_ij, E_ijk = A_and_I_ij_rect, E_ijk_rect
+        else:
+            A_and_I_ij, E_ijk = A_and_I_ij_gauss, E_ijk_gauss
+        l = Parallel(-1)(delayed(worker_day_new_components)(A_and_I_ij, E_ijk, realization, self.half_width, T, L_day,
+                                                            C, J, E_c, self.sigma, d_old)
+                         for (realization, T, L_day, C, J, E_c) in zip(self.realizations, self.time, self.L,
+                                                                       self.C, self._J, self._E_c))
+        self.C = [x[0] for x in l]
+        self._J = [x[1] for x in l]
+        self._E_c = [x[2] for x in l]
+        self.K_c = [get_K_c(E_c) for E_c in self._E_c]
+
     def set_R_true(self, R_true):
         self.R_true = R_true
 
@@ -213,15 +505,68 @@ class Cumulants(object):
         assert self.R_true is not None, "You should provide R_true."
         self.K_c_th = get_K_c_th(self.L_th, self.C_th, self.R_true)
 
-    def compute_cumulants(self, half_width=0., method="parallel_by_day", filtr='rectangular', sigma=0.):
-        self.compute_L()
-        print("L is computed")
+    def compute_cumulants(self, half_width=0., method="parallel_by_day", filtr='rectangular', sigma=0., n_blocks=0,
+                          dry_run=False, profile=None, verbose=True):
+        """
+        Computes L, C and K_c for each realization. With `method='partial_sums'` and `n_blocks` > 1,
+        the variances of their entries are estimated in the same sweep and stored in `L_var`, `C_var`
+        and `K_c_var` (see `compute_partial_sums`).
+
+        With `method='auto'`, the method with the lowest estimated runtime is picked by
+        `nphc.planner.plan` among the methods giving the same cumulants (`nphc.planner.AUTO_METHODS`):
+        `partial_sums`, whose estimates differ, is only picked when `n_blocks` > 1 requires it.
+        With `dry_run=True`, the estimated costs are printed and the `nphc.planner.Plan` is returned
+        without computing anything.
+
+        Give a `nphc.profiling.CumulantsProfile` as `profile` (or True to create one) to record the wall
+        times of the stages, realizations and pairs of components; it is stored in `self.profile`
+        and `self.profile.summary()` prints the totals.
+
+        With `verbose=False`, nothing is printed as the cumulants are computed.
+        """
+        if half_width == 0.: half_width = self.half_width
+        if method == 'auto' or dry_run:
+            from nphc.planner import plan, AUTO_METHODS
+            cumulants_plan = plan(self.realizations, half_width, filtr,
+                                  methods=('partial_sums',) if n_blocks > 1 else AUTO_METHODS)
+            if dry_run:
+                print(cumulants_plan)
+                return cumulants_plan
+            method = cumulants_plan.method
+        if n_blocks > 1 and method != 'partial_sums':
+            raise ValueError("The variances of the cumulants are only computed with `method='partial_sums'`.")
         if filtr == "gaussian" and sigma == 0.: sigma = half_width/5.
-        self.compute_C_and_J(half_width=half_width, method=method, filtr=filtr, sigma=sigma)
-        print("C is computed")
-        self.compute_E_c(half_width=half_width, method=method, filtr=filtr, sigma=sigma)
-        self.K_c = [get_K_c(self._E_c[day]) for day in range(self.n_realizations)]
-        print("K_c is computed")
+        # keep the settings to be able to add components later on
+        self.half_width = half_width
+        self.filtr = filtr
+        self.sigma = sigma
+        self.method = method
+        if profile is True:
+            from nphc.profiling import CumulantsProfile
+            profile = CumulantsProfile()
+        self.profile = profile
+        n_events = sum(len(x) for realization in self.realizations for x in realization)
+        start = time.time()
+        if method == 'partial_sums':
+            # all the cumulants are computed in a single sweep over the trigger events
+            self.compute_partial_sums(half_width=half_width, filtr=filtr, sigma=sigma, n_blocks=n_blocks,
+                                      profile=profile)
+            self.set_from_partial_sums()
+            if profile is not None: profile.record_stage('partial_sums', time.time() - start, n_events)
+            if verbose: print("L, C and K_c are computed")
+        else:
+            self.compute_L()
+            if profile is not None: profile.record_stage('L', time.time() - start, n_events)
+            if verbose: print("L is computed")
+            start = time.time()
+            self.compute_C_and_J(half_width=half_width, method=method, filtr=filtr, sigma=sigma, profile=profile)
+            if profile is not None: profile.record_stage('C', time.time() - start, n_events)
+            if verbose: print("C is computed")
+            start = time.time()
+            self.compute_E_c(half_width=half_width, method=method, filtr=filtr, sigma=sigma, profile=profile)
+            self.K_c = [get_K_c(self._E_c[day]) for day in range(self.n_realizations)]
+            if profile is not None: profile.record_stage('K_c', time.time() - start, n_events)
+            if verbose: print("K_c is computed")
         if self.R_true is not None and self.mu_true is not None:
             self.set_L_th()
             self.set_C_th()
@@ -272,6 +617,13 @@ def get_K_c_th(L, C, R):
 ## Useful fonctions to set_ empirical integrated cumulants
 ##########
 
+@autojit
+def gauss_cdf(x):
+    """
+    Cumulative distribution function of the standard gaussian distribution
+    """
+    return .5 * (1. + erf(x / sqrt(2.)))
+
 #@autojit
 #def filtr_fun(X, sigma, filtr='rectangular'):
 #    if filtr == 'rectangular':
@@ -330,7 +682,7 @@ def A_ij_gauss(realization_i, realization_j, a, b, T, L_j, sigma=1.0):
     n_i = realization_i.shape[0]
     n_j = realization_j.shape[0]
 
-    trend_j = L_j * sigma * sqrt(2 * pi) * (norm.cdf(b/sigma) - norm.cdf(a/sigma))
+    trend_j = L_j * sigma * sqrt(2 * pi) * (gauss_cdf(b/sigma) - gauss_cdf(a/sigma))
 
     for t in range(n_i):
         # count the number of jumps
@@ -424,8 +776,8 @@ def E_ijk_gauss(realization_i, realization_j, realization_k, a, b, T, L_i, L_j,
     n_j = realization_j.shape[0]
     n_k = realization_k.shape[0]
 
-    trend_i = L_i * sigma * sqrt(2 * pi) * (norm.cdf(b/sigma) - norm.cdf(a/sigma))
-    trend_j = L_j * sigma * sqrt(2 * pi) * (norm.cdf(b/sigma) - norm.cdf(a/sigma))
+    trend_i = L_i * sigma * sqrt(2 * pi) * (gauss_cdf(b/sigma) - gauss_cdf(a/sigma))
+    trend_j = L_j * sigma * sqrt(2 * pi) * (gauss_cdf(b/sigma) - gauss_cdf(a/sigma))
 
     for t in range(n_k):
         tau = realization_k[t]
@@ -574,8 +926,8 @@ def A_and_I_ij_gauss(realization_i, realization_j, half_width, T, L_j, sigma=1.0
     res_J = 0
     u = 0
     width = sqrt(2) * half_width
-    trend_C_j = L_j * sigma * sqrt(2 * pi) * (norm.cdf(half_width/sigma) - norm.cdf(-half_width/sigma))
-    trend_J_j = L_j * sigma**2 * 2 * pi * (norm.cdf(half_width/(sqrt(2)*sigma)) - norm.cdf(-half_width/(sqrt(2)*sigma)))
+    trend_C_j = L_j * sigma * sqrt(2 * pi) * (gauss_cdf(half_width/sigma) - gauss_cdf(-half_width/sigma))
+    trend_J_j = L_j * sigma**2 * 2 * pi * (gauss_cdf(half_width/(sqrt(2)*sigma)) - gauss_cdf(-half_width/(sqrt(2)*sigma)))
 
     for t in range(n_i):
         tau = realization_i[t]
@@ -615,22 +967,124 @@ def A_and_I_ij_gauss(realization_i, realization_j, half_width, T, L_j, sigma=1.0
     return res_C + res_J * 1j
 
 
-def worker_day_C_J(fun, realization, h_w, T, L, sigma, d):
+def worker_day_C_J(fun, realization, h_w, T, L, sigma, d, timed_pairs=False):
+    """
+    If `timed_pairs` is True, the wall times of the pairs shape=(d,d) are returned as well.
+    """
     C = np.zeros((d, d))
     J = np.zeros((d, d))
+    times = np.zeros((d, d))
     for i, j in product(range(d), repeat=2):
         if len(realization[i])*len(realization[j]) != 0:
+            if timed_pairs: start = time.time()
             z = fun(realization[i], realization[j], h_w, T, L[j], sigma)
+            if timed_pairs: times[i, j] = time.time() - start
             C[i,j] = z.real
             J[i,j] = z.imag
+    if timed_pairs:
+        return C + J * 1j, times
     return C + J * 1j
 
-def worker_day_E(fun, realization, h_w, T, L, J, sigma, d):
+def worker_day_E(fun, realization, h_w, T, L, J, sigma, d, timed_pairs=False):
+    """
+    If `timed_pairs` is True, the wall times of the pairs shape=(d,d) are returned as well.
+    """
     E_c = np.zeros((d, d, 2))
+    times = np.zeros((d, d))
     for i, j in product(range(d), repeat=2):
         if len(realization[i])*len(realization[j]) != 0:
+            if timed_pairs: start = time.time()
             E_c[i, j, 0] = fun(realization[i], realization[j], realization[j], -h_w, h_w,
                                   T, L[i], L[j], J[i, j], sigma)
             E_c[i, j, 1] = fun(realization[j], realization[j], realization[i], -h_w, h_w,
                                   T, L[j], L[j], J[j, j], sigma)
+            if timed_pairs: times[i, j] = time.time() - start
+    if timed_pairs:
+        return E_c, times
     return E_c
+
+
+##########
+## Per trigger event window statistics, used to build mergeable partial sums
+##########
+
+def window_stats_rect(taus, realization_j, half_width):
+    """
+    For every trigger time \tau in `taus`, computes the number of jumps of N^j in [\tau - H, \tau + H)
+    and the uncentered contribution to J, that is \sum_{\tau' \in Z^j} (2H - |\tau' - \tau|) 1_{|\tau' - \tau| < 2H}.
+    Both are obtained with binary searches and cumulated sums, so the cost does not depend on H.
+    """
+    width = 2 * half_width
+    if realization_j.shape[0] == 0:
+        return np.zeros(taus.shape[0]), np.zeros(taus.shape[0])
+    origin = realization_j[0]
+    shifted_taus = taus - origin
+    cum_j = np.concatenate(([0.], np.cumsum(realization_j - origin)))
+    count_C = np.searchsorted(realization_j, taus + half_width) - np.searchsorted(realization_j, taus - half_width)
+    a = np.searchsorted(realization_j, taus - width, side='right')
+    b = np.searchsorted(realization_j, taus)
+    c = np.searchsorted(realization_j, taus + width)
+    sum_J = (b - a) * (width - shifted_taus) + (cum_j[b] - cum_j[a])
+    sum_J += (c - b) * (width + shifted_taus) - (cum_j[c] - cum_j[b])
+    return count_C.astype(np.float64), sum_J
+
+
+@autojit
+def window_stats_gauss(taus, realization_j, half_width, sigma=1.0):
+    """
+    Gaussian counterpart of `window_stats_rect`: the jumps of N^j are weighted
+    with the same filters as in `A_and_I_ij_gauss`.
+    """
+    n = taus.shape[0]
+    n_j = realization_j.shape[0]
+    res_C = np.zeros(n)
+    res_J = np.zeros(n)
+    u = 0
+    width = sqrt(2) * half_width
+
+    for t in range(n):
+        tau = taus[t]
+        while u < n_j:
+            if realization_j[u] <= tau - width:
+                u += 1
+            else:
+                break
+        v = u
+        sub_res_C = 0.
+        sub_res_J = 0.
+        while v < n_j:
+            tau_p_minus_tau = realization_j[v] - tau
+            if tau_p_minus_tau >= width:
+                break
+            sub_res_J += sigma*sqrt(pi)*exp(-.25*(tau_p_minus_tau/sigma)**2)
+            if -half_width <= tau_p_minus_tau < half_width:
+                sub_res_C += exp(-.5*(tau_p_minus_tau/sigma)**2)
+            v += 1
+        res_C[t] = sub_res_C
+        res_J[t] = sub_res_J
+    return res_C, res_J
+
+def worker_day_new_components(fun_C_J, fun_E, realization, h_w, T, L, C, J, E_c, sigma, d_old):
+    d = len(realization)
+    new_pairs = [(i, j) for i, j in product(range(d), repeat=2) if max(i, j) >= d_old]
+    C_new = np.zeros((d, d))
+    J_new = np.zeros((d, d))
+    for i, j in new_pairs:
+        if len(realization[i])*len(realization[j]) != 0:
+            z = fun_C_J(realization[i], realization[j], h_w, T, L[j], sigma)
+            C_new[i, j] = z.real
+            J_new[i, j] = z.imag
+    # we keep the symmetric part to remove edge effects
+    C_new = 0.5 * (C_new + C_new.T)
+    J_new = 0.5 * (J_new + J_new.T)
+    C_new[:d_old, :d_old] = C
+    J_new[:d_old, :d_old] = J
+    E_c_new = np.zeros((d, d, 2))
+    E_c_new[:d_old, :d_old] = E_c
+    for i, j in new_pairs:
+        if len(realization[i])*len(realization[j]) != 0:
+            E_c_new[i, j, 0] = fun_E(realization[i], realization[j], realization[j], -h_w, h_w,
+                                     T, L[i], L[j], J_new[i, j], sigma)
+            E_c_new[i, j, 1] = fun_E(realization[j], realization[j], realization[i], -h_w, h_w,
+                                     T, L[j], L[j], J_new[j, j], sigma)
+    return C_new, J_new, E_c_new
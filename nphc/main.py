@@ -1,8 +1,8 @@
 from nphc.cumulants import Cumulants
 from nphc.utils.loader import load_data
+from nphc.backends import get_backend
 from scipy.linalg import inv, qr, sqrtm, norm
 from itertools import product
-import tensorflow as tf
 import numpy as np
 
 
@@ -18,12 +18,140 @@ def starting_point(cumulants_list,random=False):
     initial = np.dot(np.dot(sqrt_C,M),np.diag(1./sqrt_L))
     return initial
 
+def default_alpha(C_list, K_c_list):
+    return 1./(1. + (norm(np.mean([C for C in C_list],axis=0))**2) / (norm(np.mean([K_c for K_c in K_c_list],axis=0))**2) )
+
+def noise_alpha(C_var_list, K_c_var_list):
+    """
+    The value of alpha for which both terms of the cost are weighted by the inverse of the average
+    variance of the entries of the corresponding cumulant, the variances being those of
+    `Cumulants.compute_cumulants(..., n_blocks)`.
+    """
+    var_C = np.mean(C_var_list)
+    var_K_c = np.mean(K_c_var_list)
+    return var_K_c / (var_C + var_K_c)
+
 def random_orthogonal_matrix(dim):
     M = np.random.rand(dim**2).reshape(dim, dim)
     Q, _ = qr(M)
     return Q
 
 
+def solve_batch(L, C, K_c, alpha=-1, initial_points=None, max_iter=1000, tol=1e-10, gtol=0., memory=10,
+                display_step=100):
+    """
+    Solves n_problems independent NPHC problems with the same dimension at once, with the batched
+    L-BFGS of `nphc.solvers.solve_lbfgs_batch`: the problems share the batched matrix products, each
+    one stopping on its own convergence test.
+
+    Parameters
+    ----------
+
+        L : `np.array` shape=(n_problems,dim) or (n_problems,n_days,dim)
+            The means of each problem (the same number of realizations for every problem)
+
+        C, K_c : `np.array` shape=(n_problems,dim,dim) or (n_problems,n_days,dim,dim)
+
+        alpha : `float` or `np.array` shape=(n_problems,)
+            -1 for the default value of each problem, as in `NPHC.solve`
+
+        initial_points : `np.array` shape=(n_problems,dim,dim)
+            Defaults to the `starting_point` of each problem
+
+    Returns
+    -------
+
+        R : `np.array` shape=(n_problems,dim,dim)
+
+        costs : `np.array` shape=(n_problems,)
+
+        converged : `np.array` shape=(n_problems,) of `bool`
+    """
+    from nphc.solvers import solve_lbfgs_batch
+    L = np.asarray(L, dtype=np.float64)
+    C = np.asarray(C, dtype=np.float64)
+    K_c = np.asarray(K_c, dtype=np.float64)
+    if L.ndim == 2:
+        L, C, K_c = L[:, None], C[:, None], K_c[:, None]
+    n_problems = len(L)
+    if np.isscalar(alpha) and alpha == -1:
+        alpha = np.array([default_alpha(C[p], K_c[p]) for p in range(n_problems)])
+    if initial_points is None:
+        initial_points = np.array([starting_point([L[p], C[p], K_c[p]]) for p in range(n_problems)])
+    R, costs, n_iter, converged = solve_lbfgs_batch(L, C, K_c, initial_points, alpha, max_iter=max_iter, memory=memory,
+                                                    tol=tol, gtol=gtol, display_step=display_step)
+    print("Optimization Finished!")
+    return R, costs, converged
+
+
+def select_half_width(realizations, grid, folds=5, filtr='rectangular', alpha=-1, max_iter=1000, tol=1e-10,
+                      n_jobs=-1, random_state=None):
+    """
+    Selects `half_width` among the values of `grid` by cross-validation over the realizations.
+    The realizations are split in `folds` folds; for each half width and each fold, the problem is
+    solved on the cumulants of the other folds, and the solution is scored by the relative error
+    of the cumulants matching (`nphc.objective.relative_error`) on the cumulants of the held-out fold
+    computed at the largest half width of the grid. The held-out cumulants are the same for every
+    half width, so that the scores are comparable: the cumulants at a small half width are easier to
+    match, but miss the tails of the kernels. With short realizations, the held-out cumulants at the
+    largest half width are noisy, which favors the small half widths: the grid should not go far
+    beyond the expected support of the kernels.
+
+    The partial sums of every realization are computed for the whole grid in one parallel pass over the
+    realizations (see `nphc.accumulator.CumulantsAccumulator`) and shared by all the folds: the held-out
+    cumulants are those of their merge. The (half width, fold) pairs then run in `n_jobs` parallel jobs.
+
+    For the same reason, the weight `alpha` is shared: when `alpha=-1`, `default_alpha` is computed once,
+    on the cumulants of all the realizations at the largest half width of the grid, and used for every
+    half width and every fold.
+
+    Returns
+    -------
+
+        half_width : `float`
+            The value of `grid` with the lowest average score
+
+        scores : `np.array` shape=(len(grid),folds)
+    """
+    from nphc.accumulator import worker_day_grid_accumulators, merge_accumulators
+    from nphc.solvers import cross_validation_score
+    from joblib import Parallel, delayed
+    if not all(isinstance(x, list) for x in realizations):
+        realizations = [realizations]
+    n_days = len(realizations)
+    assert 2 <= folds <= n_days, "`folds` should be between 2 and the number of realizations."
+    rng = np.random.RandomState(random_state)
+    fold_days = np.array_split(rng.permutation(n_days), folds)
+
+    sigmas = [half_width / 5. if filtr == 'gaussian' else 1.0 for half_width in grid]
+    # accumulators[day][h]
+    accumulators = Parallel(n_jobs)(delayed(worker_day_grid_accumulators)(realization, grid, filtr, sigmas)
+                                    for realization in realizations)
+    h_max = int(np.argmax(grid))
+    if alpha == -1:
+        _, C_all, _, _, K_c_all = merge_accumulators([accs[h_max] for accs in accumulators]).finalize()
+        alpha = default_alpha([C_all], [K_c_all])
+    # held-out cumulants of each fold, at the largest half width
+    tests = []
+    for days in fold_days:
+        L_test, C_test, _, _, K_c_test = merge_accumulators([accumulators[day][h_max] for day in days]).finalize()
+        tests.append((L_test, C_test, K_c_test))
+    jobs = []
+    for h in range(len(grid)):
+        day_accs = [accs[h] for accs in accumulators]
+        cumulants = [acc.finalize() for acc in day_accs]
+        L = np.array([c[0] for c in cumulants])
+        C = np.array([c[1] for c in cumulants])
+        K_c = np.array([c[4] for c in cumulants])
+        for days, test in zip(fold_days, tests):
+            train = np.setdiff1d(np.arange(n_days), days)
+            R0 = starting_point([L[train], C[train], K_c[train]])
+            jobs.append((L[train], C[train], K_c[train]) + test + (alpha, R0))
+    scores = Parallel(n_jobs)(delayed(cross_validation_score)(*job, max_iter=max_iter, tol=tol) for job in jobs)
+    scores = np.array(scores).reshape(len(grid), folds)
+    return np.asarray(grid)[np.argmin(np.mean(scores, axis=1))], scores
+
+
 class NPHC(object):
     """
     A class that implements non-parametric estimation described in th paper
@@ -38,6 +166,8 @@ class NPHC(object):
 
         solve : minimize the objective function
 
+        bootstrap : quantiles of the estimate of G over bootstrap replicates of the realizations
+
 
     Attributes
     ----------
@@ -61,8 +191,10 @@ class NPHC(object):
 
         # we will store here the optimal cost reached
         self.optcost = None
+        self.R = None
 
-    def fit(self, realizations=[], half_width=100., filtr='rectangular', method="parallel", mu_true=None, R_true=None):
+    def fit(self, realizations=[], half_width=100., filtr='rectangular', method="parallel", mu_true=None, R_true=None,
+            n_blocks=0, verbose=True):
         """
         Set the corresponding realization(s) of the process.
         Compute the cumulants.
@@ -75,6 +207,14 @@ class NPHC(object):
                 the time stamps of a node of the Hawkes process
                 * Or a list of realizations represented as above.
 
+            n_blocks : `int`
+                With `method='partial_sums'`, if `n_blocks` > 1 the variances of the entries of the cumulants
+                are estimated in the same sweep, by a jackknife over `n_blocks` time blocks per realization,
+                and stored in `L_var`, `C_var` and `K_c_var`.
+
+            verbose : `bool`
+                Whether to print the progress of the computation of the cumulants
+
         """
         if all(isinstance(x,list) for x in realizations):
             self.realizations = realizations
@@ -84,11 +224,15 @@ class NPHC(object):
         cumul = Cumulants(realizations, half_width=half_width)
         cumul.mu_true = mu_true
         cumul.R_true = R_true
-        cumul.compute_cumulants(half_width,filtr=filtr,method=method,sigma=half_width/5.)
+        cumul.compute_cumulants(half_width,filtr=filtr,method=method,sigma=half_width/5.,n_blocks=n_blocks,
+                               verbose=verbose)
 
         self.L = cumul.L.copy()
         self.C = cumul.C.copy()
         self.K_c = cumul.K_c.copy()
+        self.L_var = cumul.L_var
+        self.C_var = cumul.C_var
+        self.K_c_var = cumul.K_c_var
         if R_true is not None and mu_true is not None:
             self.L_th = cumul.L_th
             self.C_th = cumul.C_th
@@ -100,154 +244,202 @@ class NPHC(object):
 
 
     def solve(self, alpha=-1, l_l1=0., l_l2=0., initial_point=None, training_epochs=1000, learning_rate=1e6, optimizer='momentum', \
-         display_step = 100, use_average=False, use_projection=False, projection_stable_G=False, positive_baselines=False, l_mu=0.):
+         display_step = 100, use_average=False, use_projection=False, projection_stable_G=False, positive_baselines=False, l_mu=0., \
+         backend='tensorflow', batch_size=1, n_starts=1, n_jobs=1, tol=None, gtol=None, callback=None, trace=False, \
+         solver='lbfgs', space=None, projection_method='exact', projection_period=1):
         """
 
         Parameters
         ----------
 
+            alpha : `float` or `str`
+                Weight of the covariance in the cost. -1 for the default value based on the norms of C and K_c,
+                'noise' for `noise_alpha` with the variances estimated by `fit(..., n_blocks)`.
+
             training_epochs : `int`
-                The number of training epochs.
+                The number of training epochs (the maximum number of iterations with `backend='numpy'`).
 
             learning_rate : `float`
                 The learning rate used by the optimizer.
 
             optimizer : `str`
                 The optimizer used to minimize the objective function. We use optimizers from TensorFlow.
+                The TensorFlow graph is built once for each dimension, optimizer and structure of the
+                penalties, then reused by the following calls.
+
+            batch_size : `int`
+                The number of realizations drawn at each stochastic step (when `use_average` is False).
+
+            backend : `str`
+                The name of a backend of `nphc.backends`, imported on the first call:
+                * 'tensorflow': first-order optimizers of TensorFlow
+                * 'numpy': the solvers of `nphc.solvers` (see `solver`), with the gradient computed in closed form.
+                `learning_rate` and `optimizer` are not used, only `projection_stable_G` is supported, with 'fista'.
+
+            solver : `str`
+                The algorithm used with `backend='numpy'`:
+                * 'lbfgs': L-BFGS-B on R, the penalties are handled through their (sub)gradients
+                * 'fista': accelerated proximal gradient on G = I - R^{-1}, with the proximal operators of
+                `nphc.utils.prox` for the l1 and l2 penalties and `stability` if `projection_stable_G`
+                * 'svrg', 'saga': variance-reduced stochastic gradient on R over the realizations, with
+                `batch_size` realizations per step and `training_epochs` passes over them; the step is set
+                by a line search (see `nphc.solvers.solve_variance_reduced`)
+                * 'newton': trust-region Newton conjugate gradient on R with the exact Hessian-vector products
+                of `nphc.objective.hess_vec`, for small and medium dimensions (see `nphc.solvers.solve_newton`)
+
+            space : `str`
+                The variable of the solvers of `backend='numpy'`, 'R' or 'G' = I - R^{-1}. In 'G', the
+                penalties need no matrix inversion and R is obtained from a cached LU factorization of
+                I - G (see `nphc.objective.GSpaceObjective`). Defaults to 'R' with 'lbfgs', 'G' with 'fista'.
+
+            projection_method : `str`
+                * 'exact': the projections of `use_projection` and `projection_stable_G` use full SVDs
+                * 'approximate': Newton-Schulz iterations for the orthogonal projection, and clipping of the
+                leading singular values of G only, found by a randomized SVD (see `nphc.utils.prox`).
+                Much cheaper at large dimension.
+
+            projection_period : `int`
+                With `backend='tensorflow'`, the projections run every `projection_period` epochs.
+
+            n_starts : `int`
+                The number of starting points: the default one (or `initial_point`) and
+                `n_starts - 1` random ones built with `random_orthogonal_matrix`. The solution with the
+                lowest cost is returned, the final cost of every start is stored in `start_costs`.
+                With `backend='numpy'`, the starts run in `n_jobs` parallel jobs; with `solver='lbfgs'`,
+                the clearly losing ones are pruned along the way (see `nphc.solvers.solve_multistart`).
+
+            tol : `float`
+                Stop when the relative change of the cost between two iterations is below `tol`.
+                Defaults to 1e-10 with `backend='numpy'` (1e-14 with `solver='newton'`), and to no stopping
+                with 'tensorflow'.
+
+            gtol : `float`
+                Stop when the norm of the gradient is below `gtol`.
+
+            callback : callable
+                Called as `callback(iteration, R, cost, grad_norm)` after each iteration, the solver
+                stops if it returns True. Not supported with `n_starts` > 1 and `backend='numpy'`.
+
+            trace : `bool`
+                If True, `self.trace` holds a structured np.array with the iteration, wall time, cost,
+                gradient norm and projection time of each iteration (of the start with the lowest cost).
         """
 
         if use_projection:
             self.alpha = 0.
+        elif alpha == 'noise':
+            assert getattr(self, 'C_var', None) is not None, "Call `fit` with `n_blocks` > 1 to use alpha='noise'."
+            self.alpha = noise_alpha(self.C_var, self.K_c_var)
         elif alpha == -1:
-            self.alpha = 1./(1. + (norm(np.mean([C for C in self.C],axis=0))**2) / (norm(np.mean([K_c for K_c in self.K_c],axis=0))**2) )
+            self.alpha = default_alpha(self.C, self.K_c)
         else:
             self.alpha = alpha
 
         self.l_l1 = l_l1
         self.l_l2 = l_l2
+        self.l_mu = l_mu if positive_baselines else 0.
 
         cumulants_list = [self.L, self.C, self.K_c]
-        d = len(self.L[0])
         if initial_point is None:
             start_point = starting_point(cumulants_list, random=False)
         else:
             start_point = initial_point.copy()
 
-        R0 = tf.constant(start_point.astype(np.float64), shape=[d,d])
-        L = tf.placeholder(tf.float64, d, name='L')
-        C = tf.placeholder(tf.float64, (d,d), name='C')
-        K_c = tf.placeholder(tf.float64, (d,d), name='K_c')
-
-        R = tf.Variable(R0, name='R', dtype=tf.float64)
+        starts = [start_point] + [starting_point(cumulants_list, random=True) for _ in range(n_starts - 1)]
+
+        solve_backend = get_backend(backend)
+        R, self.optcost, self.start_costs, self.trace = solve_backend(
+            self.L, self.C, self.K_c, starts, self.alpha, l_l1=self.l_l1, l_l2=self.l_l2,
+            positive_baselines=positive_baselines, l_mu=l_mu, training_epochs=training_epochs,
+            learning_rate=learning_rate, optimizer=optimizer, display_step=display_step, use_average=use_average,
+            use_projection=use_projection, projection_stable_G=projection_stable_G,
+            projection_method=projection_method, projection_period=projection_period, batch_size=batch_size,
+            n_jobs=n_jobs, tol=tol, gtol=gtol, callback=callback, trace=trace, solver=solver, space=space)
+        self.R = R
+        # the problem solved, replicated by `bootstrap`
+        self.solve_options = dict(use_average=use_average, use_projection=use_projection,
+                                  projection_stable_G=projection_stable_G, projection_method=projection_method)
+        return R
+
+    def bootstrap(self, n_boot=200, quantiles=(0.025, 0.975), max_iter=1000, tol=1e-10, n_jobs=-1, random_state=None):
+        """
+        Bootstrap of the estimate of G = I - R^{-1} over the realizations: each replicate draws
+        n_days days with replacement and minimizes the objective of `solve` (same alpha, penalties,
+        averaging and projections) on their cumulants, warm-started from the solution `R` of the last
+        call to `solve` (see `nphc.solvers.solve_bootstrap_replicates`). The replicates run in chunks in `n_jobs` parallel jobs.
+        The estimates of the replicates are stored in `bootstrap_G` shape=(n_boot,dim,dim).
 
-        #I = tf.diag(tf.ones(d,dtype=tf.float64))
-        I = tf.Variable(initial_value=np.eye(d), dtype=tf.float64)
+        Returns
+        -------
 
-        # Construct model
-        activation_3 = tf.matmul(C,tf.square(R),transpose_b=True) + 2.0*tf.matmul(R,R*C,transpose_b=True) \
-                       - 2.0*tf.matmul(R,tf.matmul(tf.diag(L),tf.square(R),transpose_b=True))
-        activation_2 = tf.matmul(R,tf.matmul(tf.diag(L),R,transpose_b=True))
+            G_quantiles : `np.array` shape=(len(quantiles),dim,dim)
+                The elementwise quantiles of G over the replicates
+        """
+        assert getattr(self, 'R', None) is not None, "You should call `solve` first."
+        from nphc.solvers import solve_bootstrap_replicates
+        from joblib import Parallel, delayed, effective_n_jobs
+        rng = np.random.RandomState(random_state)
+        n_days = len(self.L)
+        day_samples = rng.randint(0, n_days, (n_boot, n_days))
+        chunks = np.array_split(day_samples, min(n_boot, effective_n_jobs(n_jobs)))
+        res = Parallel(n_jobs)(delayed(solve_bootstrap_replicates)(self.L, self.C, self.K_c, self.alpha, self.R, chunk,
+                                                                   self.l_l1, self.l_l2, self.l_mu, max_iter, tol,
+                                                                   **self.solve_options)
+                               for chunk in chunks)
+        self.bootstrap_G = np.concatenate(res)
+        return np.percentile(self.bootstrap_G, 100. * np.asarray(quantiles), axis=0)
+
+    def solve_path(self, l_l1_grid, l_l2_grid=[0.], alpha=-1, initial_point=None, max_iter=1000, tol=1e-10,
+                   positive_baselines=False, l_mu=0., n_jobs=1, space='R'):
+        """
+        Solves the problem for every pair (l_l1, l_l2) of the grids with the L-BFGS-B solver of
+        `backend='numpy'`. Both grids are visited from the strongest penalty to the weakest, each solve
+        being warm-started from the previous solution and stopped on the tolerance `tol`: the largest
+        l_l1 is first solved along the l_l2 grid, then each segment of the path (one per l_l2) visits
+        the l_l1 grid from that solution. The segments run in `n_jobs` parallel jobs. `space` is the
+        variable of the solver, see `solve`.
 
-        cost =  (1-self.alpha) * tf.reduce_mean( tf.squared_difference( activation_3, K_c ) ) \
-        + self.alpha * tf.reduce_mean( tf.squared_difference( activation_2, C ) )
+        Returns
+        -------
 
-        reg_l1 = tf.contrib.layers.l1_regularizer(self.l_l1)
-        reg_l2 = tf.contrib.layers.l2_regularizer(self.l_l2)
+            R_path : `np.array` shape=(len(l_l2_grid),len(l_l1_grid),dim,dim)
+                R_path[j, i] is the solution for l_l1 = l_l1_grid[i] and l_l2 = l_l2_grid[j]
 
-        if (self.l_l2 * self.l_l1 > 0):
-            cost = tf.cast(cost, tf.float64) + reg_l1((I - tf.matrix_inverse(R))) + reg_l2((I - tf.matrix_inverse(R)))
-        elif (self.l_l1 > 0):
-            cost = tf.cast(cost, tf.float64) + reg_l1((I - tf.matrix_inverse(R)))
-        elif (self.l_l2 > 0):
-            cost = tf.cast(cost, tf.float64) + reg_l2((I - tf.matrix_inverse(R)))
+            costs : `np.array` shape=(len(l_l2_grid),len(l_l1_grid))
+        """
+        from nphc.solvers import solve_path_segment
+        from joblib import Parallel, delayed
+        if alpha == -1:
+            self.alpha = default_alpha(self.C, self.K_c)
         else:
-            cost = tf.cast(cost, tf.float64)
-
-        # always use the average cumulants over all realizations
-        if use_average or use_projection or projection_stable_G or positive_baselines:
-            L_avg = np.mean(self.L, axis=0)
-            C_avg = np.mean(self.C, axis=0)
-            K_avg = np.mean(self.K_c, axis=0)
-        if use_projection:
-            L_avg_sqrt = np.sqrt(L_avg)
-            L_avg_sqrt_inv = 1./L_avg_sqrt
-            from scipy.linalg import inv, sqrtm
-            C_avg_sqrt = sqrtm(C_avg)
-            C_avg_sqrt_inv = inv(C_avg_sqrt)
-        if projection_stable_G or positive_baselines:
-            from scipy.linalg import inv
-            C_avg_inv = inv(C_avg)
-
-        if positive_baselines:
-            #neg_baselines = - tf.matmul(tf.matmul(np.diag(L_avg),R,transpose_b=True),\
-            #                            np.dot(C_avg_inv,L_avg.reshape(d,1)))
-            neg_baselines = - tf.matmul(tf.matrix_inverse(R), L_avg.reshape(d,1))
-            cost += l_mu * tf.reduce_sum(tf.nn.relu(neg_baselines))
-
-        if optimizer == 'momentum':
-            optimizer = tf.train.MomentumOptimizer(learning_rate, momentum=0.9).minimize(cost)
-        elif optimizer == 'adam':
-            optimizer = tf.train.AdamOptimizer(learning_rate).minimize(cost)
-        elif optimizer == 'adagrad':
-            optimizer = tf.train.AdagradOptimizer(learning_rate).minimize(cost)
-        elif optimizer == 'rmsprop':
-            optimizer = tf.train.RMSPropOptimizer(learning_rate).minimize(cost)
-        elif optimizer == 'adadelta':
-            optimizer = tf.train.AdadeltaOptimizer(learning_rate).minimize(cost)
+            self.alpha = alpha
+        if initial_point is None:
+            start_point = starting_point([self.L, self.C, self.K_c], random=False)
         else:
-            optimizer = tf.train.GradientDescentOptimizer(learning_rate).minimize(cost)
-
-        # Initialize the variables
-        init = tf.global_variables_initializer()
-
-        # Launch the graph
-        with tf.Session() as sess:
-            sess.run(init)
-
-            # Set logs writer into folder /tmp/tf_cumul
-            #summary_writer = tf.train.SummaryWriter('/tmp/tf_cumul', graph=sess.graph)
-
-            # Training cycle
-            for epoch in range(training_epochs):
-
-                if epoch % display_step == 0:
-                    avg_cost = np.average([sess.run(cost, feed_dict={L: L_, C: C_, K_c: K_c_})
-                                           for (L_, C_, K_c_) in zip(self.L, self.C, self.K_c)])
-                    print("Epoch:", '%04d' % (epoch), "log10(cost)=", "{:.9f}".format(np.log10(avg_cost)))
-
-                if use_average:
-                    sess.run(optimizer, feed_dict={L: L_avg, C: C_avg, K_c: K_avg})
-
-                elif use_projection:
-                    # Fit training using batch data
-                    i = np.random.randint(0,len(self.realizations))
-                    sess.run(optimizer, feed_dict={L: self.L[i], C: self.C[i], K_c: self.K_c[i]})
-                    to_be_projected = np.dot(C_avg_sqrt_inv,np.dot(sess.run(R),np.diag(L_avg_sqrt)))
-                    U, S, V = np.linalg.svd(to_be_projected)
-                    R_projected = np.dot( C_avg_sqrt, np.dot( np.dot(U,V), np.diag(L_avg_sqrt_inv) ) )
-                    assign_op = R.assign(R_projected)
-                    sess.run(assign_op)
-                else:
-                    # Fit training using batch data
-                    i = np.random.randint(0,len(self.realizations))
-                    sess.run(optimizer, feed_dict={L: self.L[i], C: self.C[i], K_c: self.K_c[i]})
-
-                if projection_stable_G:
-                    to_be_projected = np.eye(d) - np.dot( np.dot(np.diag(L_avg), sess.run(tf.transpose(R))), C_avg_inv)
-                    U, S, V = np.linalg.svd(to_be_projected)
-                    S[S >= .99] = .99
-                    G_projected = np.dot( U, np.dot(np.diag(S), V) )
-                    R_projected = np.dot(C_avg, np.dot( np.eye(d) - G_projected.T, np.diag(1./L_avg) ) )
-                    assign_op = R.assign(R_projected)
-                    sess.run(assign_op)
-
-                # Write logs at every iteration
-                #summary_str = sess.run(merged_summary_op, feed_dict={L: cumul.L, C: cumul.C, K_c: cumul.K_c})
-                #summary_writer.add_summary(summary_str, epoch)
-
-            print("Optimization Finished!")
-
-            return sess.run(R)
+            start_point = initial_point.copy()
+
+        l_mu = l_mu if positive_baselines else 0.
+        order = np.argsort(l_l1_grid)[::-1]
+        l_l1_sorted = np.asarray(l_l1_grid, dtype=np.float64)[order]
+        order_l2 = np.argsort(l_l2_grid)[::-1]
+        l_l2_sorted = np.asarray(l_l2_grid, dtype=np.float64)[order_l2]
+        # starting points of the segments: the largest l_l1 along the l_l2 grid
+        segment_starts = []
+        R = start_point
+        for l_l2 in l_l2_sorted:
+            R = solve_path_segment(self.L, self.C, self.K_c, self.alpha, l_l1_sorted[:1], l_l2, R, l_mu,
+                                   max_iter, tol, space)[0][0]
+            segment_starts.append(R)
+        res = Parallel(n_jobs)(delayed(solve_path_segment)(self.L, self.C, self.K_c, self.alpha, l_l1_sorted, l_l2,
+                                                           R0, l_mu, max_iter, tol, space)
+                               for (l_l2, R0) in zip(l_l2_sorted, segment_starts))
+        d = start_point.shape[0]
+        R_path = np.zeros((len(l_l2_grid), len(l_l1_grid), d, d))
+        costs = np.zeros((len(l_l2_grid), len(l_l1_grid)))
+        for j, (R_segment, costs_segment) in zip(order_l2, res):
+            R_path[j, order] = R_segment
+            costs[j, order] = costs_segment
+        return R_path, costs
 
 
 '''
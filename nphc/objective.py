@@ -0,0 +1,312 @@
+from scipy.linalg import lu_factor, lu_solve
+import numpy as np
+
+
+def activations(R, L, C):
+    """
+    Returns the integrated covariance and skewness (sliced) predicted by R, that is
+    activation_2 = R diag(L) R^T
+    activation_3 = C (R*R)^T + 2 R (R*C)^T - 2 R diag(L) (R*R)^T
+    The cumulants can be stacked along leading axes, L shape=(..., dim) and C shape=(..., dim, dim),
+    in which case all the sets are handled with batched matrix products.
+    """
+    R2 = R * R
+    R_L = R * L[..., None, :]
+    activation_2 = np.matmul(R_L, np.swapaxes(R, -1, -2))
+    activation_3 = np.matmul(C, np.swapaxes(R2, -1, -2)) + 2. * np.matmul(R, np.swapaxes(R * C, -1, -2)) \
+                   - 2. * np.matmul(R_L, np.swapaxes(R2, -1, -2))
+    return activation_2, activation_3
+
+
+def grad_from_errors(R, L, C, E_2, E_3, alpha):
+    """
+    Gradient with respect to R of the cumulants matching cost, given the errors
+    E_2 = activation_2 - C and E_3 = activation_3 - K_c. It is linear in (E_2, E_3).
+    `alpha` may be an np.array with the leading shape of the stack.
+    """
+    d = R.shape[-1]
+    alpha = np.asarray(alpha)[..., None, None]
+    L_row = L[..., None, :]
+    E_3_T = np.swapaxes(E_3, -1, -2)
+    grad_2 = np.matmul(E_2 + np.swapaxes(E_2, -1, -2), R) * L_row
+    E_3_T_R = np.matmul(E_3_T, R)
+    grad_3 = 2. * R * np.matmul(E_3_T, C) + 2. * np.matmul(E_3, R * C) + 2. * C * E_3_T_R \
+             - 2. * np.matmul(E_3, R * R) * L_row - 4. * R * E_3_T_R * L_row
+    return 2. / d ** 2 * ((1. - alpha) * grad_3 + alpha * grad_2)
+
+
+def cost_and_grad(R, L, C, K_c, alpha):
+    """
+    Cost of the cumulants matching for each set of cumulants, and its gradient with respect to R.
+    The cost is
+    (1 - alpha) * mean( (activation_3 - K_c)^2 ) + alpha * mean( (activation_2 - C)^2 )
+    With stacked cumulants (see `activations`), both have the leading shape of the stack, and `alpha`
+    may be an np.array of this shape.
+    """
+    activation_2, activation_3 = activations(R, L, C)
+    E_2 = activation_2 - C
+    E_3 = activation_3 - K_c
+    cost = (1. - alpha) * np.mean(E_3 ** 2, axis=(-2, -1)) + alpha * np.mean(E_2 ** 2, axis=(-2, -1))
+    return cost, grad_from_errors(R, L, C, E_2, E_3, alpha)
+
+
+def hess_vec(R, V, L, C, K_c, alpha):
+    """
+    Product of the Hessian of the cumulants matching cost at R with the direction V shape=(dim,dim),
+    for each set of cumulants. It is the derivative of `grad_from_errors` along V: the gradient
+    evaluated at the derivatives of the errors (dE_2, dE_3), plus the derivative with the errors fixed.
+    """
+    d = R.shape[-1]
+    activation_2, activation_3 = activations(R, L, C)
+    E_2 = activation_2 - C
+    E_3 = activation_3 - K_c
+    L_row = L[..., None, :]
+    R2 = R * R
+    RV = R * V
+    V_L = V * L_row
+    R_L = R * L_row
+    # derivatives of the activations along V
+    dE_2 = np.matmul(V_L, np.swapaxes(R, -1, -2)) + np.matmul(R_L, np.swapaxes(V, -1, -2))
+    dE_3 = 2. * np.matmul(C, np.swapaxes(RV, -1, -2)) + 2. * np.matmul(V, np.swapaxes(R * C, -1, -2)) \
+           + 2. * np.matmul(R, np.swapaxes(V * C, -1, -2)) - 2. * np.matmul(V_L, np.swapaxes(R2, -1, -2)) \
+           - 4. * np.matmul(R_L, np.swapaxes(RV, -1, -2))
+    res = grad_from_errors(R, L, C, dE_2, dE_3, alpha)
+    # derivative of the gradient with respect to R, the errors being fixed
+    E_3_T = np.swapaxes(E_3, -1, -2)
+    E_3_T_R = np.matmul(E_3_T, R)
+    E_3_T_V = np.matmul(E_3_T, V)
+    d_grad_2 = np.matmul(E_2 + np.swapaxes(E_2, -1, -2), V) * L_row
+    d_grad_3 = 2. * V * np.matmul(E_3_T, C) + 2. * np.matmul(E_3, V * C) + 2. * C * E_3_T_V \
+               - 4. * np.matmul(E_3, RV) * L_row - 4. * V * E_3_T_R * L_row - 4. * R * E_3_T_V * L_row
+    return res + 2. / d ** 2 * ((1. - alpha) * d_grad_3 + alpha * d_grad_2)
+
+
+def relative_error(R, L, C, K_c, alpha):
+    """
+    Relative error of the cumulants matching
+    (1 - alpha) * ||activation_3 - K_c||^2 / ||K_c||^2 + alpha * ||activation_2 - C||^2 / ||C||^2
+    which, unlike the cost, does not depend on the scale of the cumulants.
+    """
+    activation_2, activation_3 = activations(R, L, C)
+    return (1. - alpha) * np.sum((activation_3 - K_c) ** 2) / np.sum(K_c ** 2) \
+           + alpha * np.sum((activation_2 - C) ** 2) / np.sum(C ** 2)
+
+
+class NPHCObjective(object):
+    """
+    The objective minimized in `NPHC.solve`, evaluated with NumPy: the average over the realizations
+    of the cumulants matching cost, plus the optional penalties on G = I - R^{-1} and on negative baselines.
+    The cumulants are stacked in arrays shape=(n_days, ...) so that the cost over all the realizations,
+    or a minibatch of them, is computed with a few batched matrix products.
+
+
+    Parameters
+    ----------
+
+        L, C, K_c : `list` of `np.array` or `np.array` shape=(n_days, ...)
+            The cumulants of each realization
+
+        alpha : `float`
+            Weight of the covariance in the cumulants matching cost
+
+        l_l1, l_l2 : `float`
+            Weights of the l1 and squared l2 penalties on G (the l2 penalty is l_l2 * ||G||^2 / 2,
+            as with the TensorFlow regularizers)
+
+        l_mu : `float`
+            Weight of the penalty on the negative parts of the baselines R^{-1} L_avg
+    """
+
+    def __init__(self, L, C, K_c, alpha=0.5, l_l1=0., l_l2=0., l_mu=0.):
+        self.L = np.asarray(L, dtype=np.float64)
+        self.C = np.asarray(C, dtype=np.float64)
+        self.K_c = np.asarray(K_c, dtype=np.float64)
+        self.n_days, self.dim = self.L.shape
+        self.alpha = alpha
+        self.l_l1 = l_l1
+        self.l_l2 = l_l2
+        self.l_mu = l_mu
+        self.L_avg = np.mean(self.L, axis=0)
+
+    def matching_cost_and_grad(self, R, days=None):
+        """
+        Returns the cumulants matching cost, without the penalties, and its gradient with respect to R,
+        averaged over all the realizations or over the realizations whose indices are in `days`.
+        """
+        if days is None:
+            L, C, K_c = self.L, self.C, self.K_c
+        else:
+            L, C, K_c = self.L[days], self.C[days], self.K_c[days]
+        cost, grad = cost_and_grad(R, L, C, K_c, self.alpha)
+        return np.mean(cost), np.mean(grad, axis=0)
+
+    def day_costs_and_grads(self, R, days):
+        """
+        Returns the cumulants matching costs shape=(len(days),) and gradients shape=(len(days),dim,dim)
+        of each realization whose index is in `days`, without the penalties.
+        """
+        return cost_and_grad(R, self.L[days], self.C[days], self.K_c[days], self.alpha)
+
+    def cost_and_grad(self, R, days=None):
+        """
+        Returns the cost and its gradient with respect to R, averaged over all the realizations
+        or over the realizations whose indices are in `days`.
+        """
+        cost, grad = self.matching_cost_and_grad(R, days)
+        if self.l_l1 > 0 or self.l_l2 > 0 or self.l_mu > 0:
+            cost_pen, grad_pen = self.penalties(R)
+            cost += cost_pen
+            grad += grad_pen
+        return cost, grad
+
+    def cost(self, R, days=None):
+        return self.cost_and_grad(R, days)[0]
+
+    def hessp(self, R, V, days=None):
+        """
+        Returns the product of the Hessian of the cost at R with the direction V, averaged over all the
+        realizations or over the realizations whose indices are in `days`. The l1 penalty counts through
+        the curvature of G = I - R^{-1} only, the sign of G being locally constant.
+        """
+        if days is None:
+            L, C, K_c = self.L, self.C, self.K_c
+        else:
+            L, C, K_c = self.L[days], self.C[days], self.K_c[days]
+        res = np.mean(hess_vec(R, V, L, C, K_c, self.alpha), axis=0)
+        if self.l_l1 > 0 or self.l_l2 > 0 or self.l_mu > 0:
+            res += self.penalties_hessp(R, V)
+        return res
+
+    def penalties_hessp(self, R, V):
+        """
+        Returns the derivative along V of the gradient of the penalties given by `penalties`.
+        With W = R^{-1}, dW = -W V W, and dG = W V W.
+        """
+        d = self.dim
+        W = np.linalg.inv(R)
+        W_T = W.T
+        res = np.zeros((d, d))
+        if self.l_l1 > 0 or self.l_l2 > 0:
+            G = np.eye(d) - W
+            grad_G = self.l_l1 * np.sign(G) + self.l_l2 * G
+            grad = np.dot(W_T, np.dot(grad_G, W_T))
+            dG = np.dot(W, np.dot(V, W))
+            res += - np.dot(W_T, np.dot(V.T, grad)) - np.dot(grad, np.dot(V.T, W_T)) \
+                   + self.l_l2 * np.dot(W_T, np.dot(dG, W_T))
+        if self.l_mu > 0:
+            mu = np.dot(W, self.L_avg)
+            negative = (mu < 0).astype(np.float64)
+            W_T_neg = np.dot(W_T, negative)
+            res += - self.l_mu * np.outer(np.dot(W_T, np.dot(V.T, W_T_neg)), mu) \
+                   - self.l_mu * np.outer(W_T_neg, np.dot(W, np.dot(V, mu)))
+        return res
+
+    def penalties(self, R):
+        """
+        Returns the value of the penalties and their (sub)gradient with respect to R.
+        Since dG = R^{-1} dR R^{-1}, a gradient M with respect to G gives R^{-T} M R^{-T}.
+        """
+        d = self.dim
+        R_inv = np.linalg.inv(R)
+        cost = 0.
+        grad_G = np.zeros((d, d))
+        grad = np.zeros((d, d))
+        if self.l_l1 > 0 or self.l_l2 > 0:
+            G = np.eye(d) - R_inv
+            cost += self.l_l1 * np.sum(np.abs(G)) + .5 * self.l_l2 * np.sum(G ** 2)
+            grad_G += self.l_l1 * np.sign(G) + self.l_l2 * G
+            grad += np.dot(R_inv.T, np.dot(grad_G, R_inv.T))
+        if self.l_mu > 0:
+            mu = np.dot(R_inv, self.L_avg)
+            negative = (mu < 0).astype(np.float64)
+            cost += self.l_mu * np.sum(np.maximum(-mu, 0.))
+            grad += self.l_mu * np.outer(np.dot(R_inv.T, negative), mu)
+        return cost, grad
+
+
+class GSpaceObjective(object):
+    """
+    An `NPHCObjective` seen as a function of G = I - R^{-1}. The penalties of `objective` act on G
+    and on the baselines (I - G) L_avg, so they are evaluated without inversion; only the matching
+    cost needs R = (I - G)^{-1}. Since dR = R dG R, a gradient M with respect to R gives R^T M R^T
+    with respect to G. The cost is infinite where I - G is singular.
+
+    R is computed from the LU factorization of I - G and cached for the last G. For solvers which
+    only change a few rows of G per step (block coordinate updates), give `max_update_rank` > 0: when
+    at most that many rows changed since the last G, R is updated with the Woodbury identity in
+    O(dim^2 * rank) instead, and the factorization is recomputed after `refresh` such updates to
+    bound the accumulation of rounding errors. L-BFGS and FISTA change every entry at every step,
+    so they keep the default 0.
+    """
+
+    def __init__(self, objective, max_update_rank=0, refresh=20):
+        self.objective = objective
+        self.dim = objective.dim
+        self.max_update_rank = max_update_rank
+        self.refresh = refresh
+        self._G = None
+        self._R = None
+        self._n_updates = 0
+
+    def to_R(self, G):
+        """
+        Returns (I - G)^{-1}, raises `np.linalg.LinAlgError` if I - G is singular.
+        """
+        G = np.asarray(G, dtype=np.float64)
+        if self._G is not None and self.max_update_rank == 0:
+            if np.array_equal(G, self._G):
+                return self._R
+        elif self._G is not None:
+            changed = np.flatnonzero(np.any(G != self._G, axis=1))
+            if len(changed) == 0:
+                return self._R
+            if len(changed) <= self.max_update_rank and self._n_updates < self.refresh:
+                # I - G = (I - G_old) - U D with U the columns `changed` of the identity
+                D = (G - self._G)[changed]
+                R_cols = self._R[:, changed]
+                S = np.eye(len(changed)) - np.dot(D, R_cols)
+                R = self._R + np.dot(R_cols, np.linalg.solve(S, np.dot(D, self._R)))
+                self._cache(G, R, self._n_updates + 1)
+                return R
+        lu, piv = lu_factor(np.eye(self.dim) - G, check_finite=False)
+        if not np.all(np.isfinite(lu)) or np.any(np.diag(lu) == 0):
+            raise np.linalg.LinAlgError("Singular matrix")
+        R = lu_solve((lu, piv), np.eye(self.dim), check_finite=False)
+        self._cache(G, R, 0)
+        return R
+
+    def _cache(self, G, R, n_updates):
+        self._G = G.copy()
+        self._R = R
+        self._n_updates = n_updates
+
+    def penalties(self, G):
+        """
+        Returns the value of the penalties of `objective` and their (sub)gradient with respect to G.
+        """
+        obj = self.objective
+        cost = obj.l_l1 * np.sum(np.abs(G)) + .5 * obj.l_l2 * np.sum(G ** 2)
+        grad = obj.l_l1 * np.sign(G) + obj.l_l2 * G
+        if obj.l_mu > 0:
+            mu = obj.L_avg - np.dot(G, obj.L_avg)
+            negative = (mu < 0).astype(np.float64)
+            cost += obj.l_mu * np.sum(np.maximum(-mu, 0.))
+            grad += obj.l_mu * np.outer(negative, obj.L_avg)
+        return cost, grad
+
+    def cost_and_grad(self, G, days=None):
+        try:
+            R = self.to_R(G)
+        except np.linalg.LinAlgError:
+            return np.inf, np.zeros_like(G)
+        cost, grad_R = self.objective.matching_cost_and_grad(R, days)
+        grad = np.dot(R.T, np.dot(grad_R, R.T))
+        obj = self.objective
+        if obj.l_l1 > 0 or obj.l_l2 > 0 or obj.l_mu > 0:
+            cost_pen, grad_pen = self.penalties(G)
+            cost += cost_pen
+            grad += grad_pen
+        return cost, grad
+
+    def cost(self, G, days=None):
+        return self.cost_and_grad(G, days)[0]
@@ -0,0 +1,178 @@
+"""
+Estimates of the runtime and memory of the methods of `Cumulants.compute_cumulants`, used to pick one.
+
+The work is counted in elementary steps of the kernels: each trigger event visits the jumps of the
+other component inside its window, whose expected number is \Lambda^j times the window length, and the
+pointers of the kernels walk once through each realization. The parallel methods pay the dispatch
+of the joblib tasks and the pickling of the time stamps they receive.
+"""
+from math import sqrt
+import numpy as np
+import time
+import os
+
+
+# elementary kernel steps per second and per core, see `calibrate`
+OPS_PER_SECOND = 1e8
+# time to dispatch one joblib task, and to start the pool of workers
+TASK_OVERHEAD = 2e-4
+POOL_STARTUP = 0.5
+# bytes per second when sending time stamps to the workers
+PICKLE_BANDWIDTH = 5e8
+CHUNK_SIZE = 65536
+
+METHODS = ('classic', 'parallel_by_day', 'parallel_by_component', 'partial_sums')
+# the methods computing the same estimates of the cumulants, among which `method='auto'` picks:
+# `partial_sums` computes them differently (it only keeps the trigger events whose window lies inside
+# the observation window)
+AUTO_METHODS = ('classic', 'parallel_by_day', 'parallel_by_component')
+
+
+def dataset_stats(realizations):
+    """
+    Returns the number of jumps shape=(n_days,dim) and the durations shape=(n_days,) of the realizations.
+    """
+    counts = np.array([[len(x) for x in realization] for realization in realizations], dtype=np.float64)
+    durations = np.array([max(x[-1] for x in realization if len(x) > 0) - min(x[0] for x in realization if len(x) > 0)
+                          for realization in realizations], dtype=np.float64)
+    return counts, durations
+
+
+def kernel_work(counts, durations, half_width, filtr='rectangular', method='classic'):
+    """
+    Returns the estimated number of kernel steps of each realization shape=(n_days,).
+    """
+    d = counts.shape[1]
+    N = counts.sum(axis=1)
+    L = counts / durations[:, None]
+    Lambda = L.sum(axis=1)
+    if method == 'partial_sums':
+        if filtr == 'rectangular':
+            # binary searches in every component for each trigger event, whatever the half width
+            searches = np.sum(5. * np.log2(counts + 2.) + 10., axis=1)
+            return N * searches + 5. * d * N
+        return 2. * d * N + 2. * sqrt(2) * half_width * N * Lambda + 5. * d * N
+    # windows of A_and_I_ij (C and J) and of E_ijk
+    width_A = 4. * half_width if filtr == 'rectangular' else 2. * sqrt(2) * half_width
+    width_E = 2. * half_width
+    return 8. * d * N + (width_A + 3. * width_E) * N * Lambda + width_E * d * np.sum(counts * L, axis=1)
+
+
+def n_cores(n_jobs=-1):
+    cores = os.cpu_count() or 1
+    return cores if n_jobs < 0 else max(1, min(n_jobs, cores))
+
+
+def estimate(method, counts, durations, half_width, filtr='rectangular', n_jobs=-1, ops_per_second=None):
+    """
+    Returns the estimated kernel work, runtime (in seconds) and peak memory (in bytes) of `method`,
+    with kernels running `ops_per_second` steps per second (`OPS_PER_SECOND` by default, see `calibrate`).
+    """
+    if ops_per_second is None:
+        ops_per_second = OPS_PER_SECOND
+    n_days, d = counts.shape
+    cores = n_cores(n_jobs)
+    work = kernel_work(counts, durations, half_width, filtr, method)
+    data_bytes = 8. * counts.sum()
+    day_bytes = 8. * counts.sum(axis=1)
+    outputs = 8. * 6 * n_days * d ** 2
+    if method == 'classic':
+        runtime = work.sum() / ops_per_second
+        memory = data_bytes + outputs
+    elif method in ('parallel_by_day', 'partial_sums'):
+        workers = min(cores, n_days)
+        runtime = max(work.max(), work.sum() / workers) / ops_per_second + POOL_STARTUP \
+                  + n_days * TASK_OVERHEAD + data_bytes / PICKLE_BANDWIDTH
+        memory = data_bytes + workers * day_bytes.max() + outputs
+        if method == 'partial_sums':
+            # window statistics of a chunk of trigger events
+            memory += workers * 2. * 8 * min(CHUNK_SIZE, counts.max()) * d
+        else:
+            # both stages send the realizations
+            runtime += data_bytes / PICKLE_BANDWIDTH
+    elif method == 'parallel_by_component':
+        # three parallel calls per day, with d^2 tasks each receiving two components
+        pair_bytes = 8. * 2 * d * counts.sum(axis=1)
+        runtime = np.sum(work / cores / ops_per_second + 3 * d ** 2 * TASK_OVERHEAD + 3 * pair_bytes / PICKLE_BANDWIDTH) \
+                  + POOL_STARTUP
+        memory = data_bytes + cores * 8. * 2 * counts.max() + outputs
+    else:
+        raise ValueError("`method` should be one of %s." % ", ".join(METHODS))
+    return work.sum(), runtime, memory
+
+
+class Plan(object):
+    """
+    The estimated costs of the methods of `Cumulants.compute_cumulants` on a dataset, and the chosen method.
+
+    Attributes
+    ----------
+
+        method : `str`
+            The method with the lowest estimated runtime among the allowed ones
+
+        estimates : `dict`
+            For each method, the tuple (kernel work, runtime in seconds, peak memory in bytes)
+
+        reason : `str`
+            Why the method was chosen
+    """
+
+    def __init__(self, method, estimates, reason, n_days, dim, n_events):
+        self.method = method
+        self.estimates = estimates
+        self.reason = reason
+        self.n_days = n_days
+        self.dim = dim
+        self.n_events = n_events
+
+    def __str__(self):
+        lines = ["%d realizations, dim=%d, %d events" % (self.n_days, self.dim, self.n_events),
+                 "%-24s %12s %12s %12s" % ("method", "work", "time (s)", "memory (MB)")]
+        for method, (work, runtime, memory) in self.estimates.items():
+            mark = " <-" if method == self.method else ""
+            lines.append("%-24s %12.3g %12.3g %12.1f%s" % (method, work, runtime, memory / 2. ** 20, mark))
+        lines.append(self.reason)
+        return "\n".join(lines)
+
+    __repr__ = __str__
+
+
+def plan(realizations, half_width, filtr='rectangular', n_jobs=-1, methods=AUTO_METHODS, max_memory=None,
+         ops_per_second=None):
+    """
+    Estimates the cost of each method in `methods` on `realizations` and picks the fastest one
+    whose estimated peak memory is below `max_memory` bytes (if given).
+    """
+    counts, durations = dataset_stats(realizations)
+    estimates = dict((method, estimate(method, counts, durations, half_width, filtr, n_jobs, ops_per_second))
+                     for method in methods)
+    allowed = [method for method in methods if max_memory is None or estimates[method][2] <= max_memory]
+    if len(allowed) == 0:
+        allowed = [min(methods, key=lambda method: estimates[method][2])]
+        reason = "No method fits in the memory budget, %s needs the least memory." % allowed[0]
+        return Plan(allowed[0], estimates, reason, counts.shape[0], counts.shape[1], int(counts.sum()))
+    method = min(allowed, key=lambda method: estimates[method][1])
+    runtimes = sorted(estimates[m][1] for m in allowed)
+    reason = "%s has the lowest estimated runtime" % method
+    if len(runtimes) > 1:
+        reason += " (%.1fx faster than the next one)" % (runtimes[1] / max(runtimes[0], 1e-12))
+    reason += "."
+    return Plan(method, estimates, reason, counts.shape[0], counts.shape[1], int(counts.sum()))
+
+
+def calibrate(n_events=200000, half_width=10.):
+    """
+    Measures the speed of the kernels on a Poisson process of intensity 1 and returns it in steps per second,
+    to be given as `ops_per_second` to `estimate` and `plan` instead of the default `OPS_PER_SECOND`.
+    """
+    from nphc.cumulants import A_and_I_ij_rect
+    rng = np.random.RandomState(0)
+    x = np.cumsum(rng.exponential(1., n_events))
+    T = x[-1]
+    # compiles the kernel
+    A_and_I_ij_rect(x[:100], x[:100], half_width, x[99], 1., 1.)
+    start = time.time()
+    A_and_I_ij_rect(x, x, half_width, T, n_events / T, 1.)
+    elapsed = time.time() - start
+    return n_events * (2. + 4. * half_width * n_events / T) / max(elapsed, 1e-9)
@@ -0,0 +1,195 @@
+"""
+Instrumentation of `Cumulants.compute_cumulants`: wall times of the stages, of the realizations and
+of the pairs of components, and number of jumps visited inside the windows by the kernels.
+
+Nothing is measured unless a `CumulantsProfile` is given, and the kernels themselves are left untouched:
+the workers only time their calls, and the numbers of visited jumps are counted afterwards with binary
+searches on the time stamps.
+"""
+from math import sqrt
+import numpy as np
+import time
+
+
+def timed(fun, *args):
+    """
+    Returns the output of `fun(*args)` and the wall time of the call, measured where it runs
+    (that is, inside the joblib worker when called through `delayed(timed)`).
+    """
+    start = time.time()
+    res = fun(*args)
+    return res, time.time() - start
+
+
+def window_visits(taus, realization_j, lower, upper):
+    """
+    Returns the total number of jumps of N^j in the windows (\tau + lower, \tau + upper) of the trigger times `taus`.
+    """
+    if len(taus) == 0 or len(realization_j) == 0:
+        return 0
+    return int(np.sum(np.searchsorted(realization_j, taus + upper) -
+                      np.searchsorted(realization_j, taus + lower, side='right')))
+
+
+def pair_visits(stage, realization, i, j, half_width, filtr='rectangular'):
+    """
+    Returns the number of trigger events and the number of jumps visited inside their windows by the kernel
+    of `stage` ('C' for `A_and_I_ij`, 'K_c' for both calls to `E_ijk`, 'partial_sums' for `window_stats`)
+    on the pair (i, j) of components.
+    """
+    if stage == 'C':
+        width = 2 * half_width if filtr == 'rectangular' else sqrt(2) * half_width
+        return len(realization[i]), window_visits(realization[i], realization[j], -width, width)
+    elif stage == 'K_c':
+        # E_ijk(i, j, j) and E_ijk(j, j, i) with the window (-H, H)
+        visits = window_visits(realization[j], realization[i], -half_width, half_width) \
+                 + window_visits(realization[j], realization[j], -half_width, half_width) \
+                 + 2 * window_visits(realization[i], realization[j], -half_width, half_width)
+        return len(realization[i]) + len(realization[j]), visits
+    elif stage == 'partial_sums':
+        if filtr == 'rectangular':
+            # binary searches, no window is scanned
+            return len(realization[i]), 0
+        width = sqrt(2) * half_width
+        return len(realization[i]), window_visits(realization[i], realization[j], -width, width)
+    raise ValueError("`stage` should be one of 'C', 'K_c' or 'partial_sums'.")
+
+
+class CumulantsProfile(object):
+    """
+    Records the wall times of `Cumulants.compute_cumulants`. Give it with `compute_cumulants(..., profile=profile)`.
+
+    Three kinds of records are kept, as lists of tuples:
+
+        stages : (stage, time, n_events)
+            One per stage: 'L', 'C', 'K_c' or 'partial_sums'
+
+        days : (stage, day, time, n_events)
+            One per stage and realization
+
+        pairs : (stage, day, i, j, time, n_events, n_visited)
+            One per stage, realization and pair of components on which a kernel was called. For 'K_c',
+            the time covers both calls to `E_ijk`. With `method='partial_sums'` the pairs are not timed
+            (the kernels are vectorized over the trigger events) and their time is NaN.
+
+    `n_events` is the number of trigger events, `n_visited` the number of jumps visited inside their
+    windows: if it grows faster than `n_events` times the intensity times the window width, the windows
+    of the pair are much denser than the average.
+
+    If given, `callback(kind, record)` is called with kind in ('stage', 'day', 'pair') after each record.
+    """
+
+    stage_dtype = [('stage', 'U16'), ('time', np.float64), ('n_events', np.int64)]
+    day_dtype = [('stage', 'U16'), ('day', np.int64), ('time', np.float64), ('n_events', np.int64)]
+    pair_dtype = [('stage', 'U16'), ('day', np.int64), ('i', np.int64), ('j', np.int64), ('time', np.float64),
+                  ('n_events', np.int64), ('n_visited', np.int64)]
+
+    def __init__(self, callback=None, pairs=True):
+        self.callback = callback
+        # counting the visited jumps costs a few binary searches per trigger event
+        self.record_pairs = pairs
+        self.stages = []
+        self.days = []
+        self.pairs = []
+
+    def _notify(self, kind, record):
+        if self.callback is not None:
+            self.callback(kind, record)
+
+    def record_stage(self, stage, elapsed, n_events):
+        record = (stage, elapsed, int(n_events))
+        self.stages.append(record)
+        self._notify('stage', record)
+
+    def record_day(self, stage, day, elapsed, n_events):
+        record = (stage, day, elapsed, int(n_events))
+        self.days.append(record)
+        self._notify('day', record)
+
+    def record_pair(self, stage, day, i, j, elapsed, n_events, n_visited):
+        record = (stage, day, i, j, elapsed, int(n_events), int(n_visited))
+        self.pairs.append(record)
+        self._notify('pair', record)
+
+    def record_pairs_of_day(self, stage, day, realization, times, half_width, filtr):
+        """
+        Records the pairs of a realization, `times` shape=(dim,dim) holding their wall times (NaN if not timed).
+        """
+        if not self.record_pairs:
+            return
+        d = len(realization)
+        for i in range(d):
+            for j in range(d):
+                if len(realization[i]) * len(realization[j]) != 0:
+                    n_events, n_visited = pair_visits(stage, realization, i, j, half_width, filtr)
+                    self.record_pair(stage, day, i, j, times[i, j], n_events, n_visited)
+
+    def to_arrays(self):
+        """
+        Returns the stages, days and pairs records as structured np.arrays.
+        """
+        return (np.array(self.stages, dtype=self.stage_dtype), np.array(self.days, dtype=self.day_dtype),
+                np.array(self.pairs, dtype=self.pair_dtype))
+
+    def summary(self, top=10):
+        return ProfileSummary(self, top)
+
+
+class ProfileSummary(object):
+    """
+    Totals of a `CumulantsProfile`.
+
+    Attributes
+    ----------
+
+        stage_times : `dict`
+            Wall time of each stage
+
+        events_per_second : `dict`
+            Trigger events processed per second of wall time, for each stage
+
+        visits_per_event : `dict`
+            Mean number of jumps visited inside the window of a trigger event, for each stage
+
+        slowest_days : `np.array`
+            The `top` slowest (stage, day) records
+
+        slowest_pairs : `np.array`
+            The `top` slowest (stage, day, i, j) records, or the ones with most visited jumps if
+            the pairs were not timed
+    """
+
+    def __init__(self, profile, top=10):
+        stages, days, pairs = profile.to_arrays()
+        self.stage_times = dict((s['stage'], s['time']) for s in stages)
+        self.events_per_second = dict((s['stage'], s['n_events'] / max(s['time'], 1e-12)) for s in stages)
+        self.visits_per_event = {}
+        for stage in np.unique(pairs['stage']):
+            rows = pairs[pairs['stage'] == stage]
+            self.visits_per_event[stage] = rows['n_visited'].sum() / max(rows['n_events'].sum(), 1)
+        self.total_time = stages['time'].sum()
+        self.slowest_days = np.sort(days, order='time')[::-1][:top]
+        if len(pairs) > 0 and np.all(np.isnan(pairs['time'])):
+            self.slowest_pairs = np.sort(pairs, order='n_visited')[::-1][:top]
+        else:
+            # the NaN times (untimed pairs) are sorted last
+            self.slowest_pairs = pairs[np.argsort(np.nan_to_num(pairs['time'], nan=-1.))[::-1][:top]]
+
+    def __str__(self):
+        lines = ["%-14s %10s %14s %14s" % ("stage", "time (s)", "events / s", "visits / event")]
+        for stage, elapsed in self.stage_times.items():
+            visits = self.visits_per_event.get(stage, np.nan)
+            lines.append("%-14s %10.3g %14.3g %14.3g" % (stage, elapsed, self.events_per_second[stage], visits))
+        lines.append("total %.3g s" % self.total_time)
+        if len(self.slowest_days) > 0:
+            lines.append("slowest realizations:")
+            for stage, day, elapsed, n_events in self.slowest_days:
+                lines.append("  %-12s day %-6d %10.3g s %12d events" % (stage, day, elapsed, n_events))
+        if len(self.slowest_pairs) > 0:
+            lines.append("slowest pairs:")
+            for stage, day, i, j, elapsed, n_events, n_visited in self.slowest_pairs:
+                lines.append("  %-12s day %-6d (%d, %d) %10.3g s %12d events %14d visited"
+                             % (stage, day, i, j, elapsed, n_events, n_visited))
+        return "\n".join(lines)
+
+    __repr__ = __str__
@@ -0,0 +1,727 @@
+from nphc.objective import NPHCObjective, GSpaceObjective, cost_and_grad, relative_error
+from nphc.utils.prox import prox_l1, prox_l2, stability, stability_randomized, orthogonality, \
+    orthogonality_newton_schulz
+from scipy.optimize import minimize
+import numpy as np
+import time
+
+
+class SolverTrace(object):
+    """
+    Records, at each iteration of a solver, the wall time since the start, the cost, the norm of the
+    gradient and the time spent in projections. `to_array` returns them as a structured np.array.
+
+    If given, `callback(iteration, R, cost, grad_norm)` is called after each record; the solver
+    stops if it returns True.
+    """
+
+    dtype = [('iteration', np.int64), ('time', np.float64), ('cost', np.float64),
+             ('grad_norm', np.float64), ('projection_time', np.float64)]
+
+    def __init__(self, callback=None):
+        self.callback = callback
+        self.rows = []
+        self.start = time.time()
+
+    def record(self, iteration, R, cost, grad_norm, projection_time=0.):
+        self.rows.append((iteration, time.time() - self.start, cost, grad_norm, projection_time))
+        if self.callback is not None:
+            return bool(self.callback(iteration, R, cost, grad_norm))
+        return False
+
+    def to_array(self):
+        return np.array(self.rows, dtype=self.dtype)
+
+
+def concatenate_traces(traces):
+    """
+    Concatenates the outputs of `SolverTrace.to_array` of successive runs, the iterations and times
+    of each run following those of the previous one.
+    """
+    res = []
+    iteration, elapsed = 0, 0.
+    for trace in traces:
+        trace = trace.copy()
+        trace['iteration'] += iteration
+        trace['time'] += elapsed
+        if len(trace) > 0:
+            iteration, elapsed = trace['iteration'][-1] + 1, trace['time'][-1]
+        res.append(trace)
+    return np.concatenate(res) if len(res) > 0 else np.zeros(0, dtype=SolverTrace.dtype)
+
+
+def has_converged(previous_cost, cost, grad_norm, tol=0., gtol=0.):
+    """
+    True if the relative change of the cost is below `tol`, or if the norm of the gradient is below `gtol`.
+    """
+    if tol > 0 and previous_cost is not None and abs(previous_cost - cost) <= tol * max(abs(previous_cost), abs(cost)):
+        return True
+    if gtol > 0 and grad_norm <= gtol:
+        return True
+    return False
+
+
+def solve_lbfgs(objective, R0, max_iter=1000, display_step=100, tol=1e-10, gtol=0., trace=None, space='R'):
+    """
+    Minimizes `objective` (see `nphc.objective.NPHCObjective`) with the L-BFGS-B algorithm
+    of SciPy, starting from R0. Stops after `max_iter` iterations, or when `has_converged(..., tol, gtol)`.
+    The iterations are recorded in `trace` if a `SolverTrace` is given.
+
+    If `space` is 'G', the variable is G = I - R^{-1} (see `nphc.objective.GSpaceObjective`): the
+    penalties are then evaluated without any inversion and R is obtained from a cached LU factorization.
+
+    Returns
+    -------
+
+        R : `np.array` shape=(dim,dim)
+
+        cost : `float`
+            The cost reached
+    """
+    d = R0.shape[0]
+    if space == 'G':
+        fun_obj = GSpaceObjective(objective)
+        X0 = np.eye(d) - np.linalg.inv(R0)
+        to_R = fun_obj.to_R
+    elif space == 'R':
+        fun_obj = objective
+        X0 = np.asarray(R0, dtype=np.float64)
+        to_R = lambda X: X
+    else:
+        raise ValueError("In `solve_lbfgs`: `space` should either equal `G` or `R`.")
+    # last evaluation of the objective, reused by the callback
+    state = {'iteration': 0, 'previous_cost': None}
+
+    def fun(x):
+        cost, grad = fun_obj.cost_and_grad(x.reshape(d, d))
+        state['x'], state['cost'], state['grad_norm'] = x.copy(), cost, np.linalg.norm(grad)
+        return cost, grad.ravel()
+
+    def callback(x):
+        if np.array_equal(x, state['x']):
+            cost, grad_norm = state['cost'], state['grad_norm']
+        else:
+            cost, grad = fun_obj.cost_and_grad(x.reshape(d, d))
+            grad_norm = np.linalg.norm(grad)
+        iteration = state['iteration']
+        if display_step > 0 and iteration % display_step == 0:
+            print("Iteration:", '%04d' % (iteration), "log10(cost)=", "{:.9f}".format(np.log10(cost)))
+        stop = trace is not None and trace.record(iteration, to_R(x.reshape(d, d)), cost, grad_norm)
+        stop = stop or has_converged(state['previous_cost'], cost, grad_norm, tol, gtol)
+        state['iteration'] += 1
+        state['previous_cost'] = cost
+        if stop:
+            raise StopIteration
+
+    res = minimize(fun, X0.ravel(), jac=True, method='L-BFGS-B', callback=callback,
+                   options={'maxiter': max_iter, 'ftol': 0., 'gtol': 0.})
+    return to_R(res.x.reshape(d, d)), res.fun
+
+
+def solve_newton(objective, R0, max_iter=100, display_step=10, tol=1e-14, gtol=0., trace=None, method='trust-ncg'):
+    """
+    Minimizes `objective` with a second-order method of SciPy using the exact Hessian-vector products
+    of `objective.hessp`: 'trust-ncg' (Steihaug conjugate gradient in a trust region), 'trust-krylov'
+    or 'newton-cg' (line search). Meant for small and medium dimensions, where it converges in tens of
+    iterations without any step size. Stops after `max_iter` iterations, or when
+    `has_converged(..., tol, gtol)` after an accepted step. The iterations are recorded in `trace`
+    if a `SolverTrace` is given.
+
+    Returns
+    -------
+
+        R : `np.array` shape=(dim,dim)
+
+        cost : `float`
+            The cost reached
+    """
+    if method not in ('trust-ncg', 'trust-krylov', 'newton-cg'):
+        raise ValueError("In `solve_newton`: `method` should be one of `trust-ncg`, `trust-krylov` or `newton-cg`.")
+    d = R0.shape[0]
+    state = {'iteration': 0, 'previous_cost': None, 'previous_x': None}
+
+    def fun(x):
+        cost, grad = objective.cost_and_grad(x.reshape(d, d))
+        state['x'], state['cost'], state['grad_norm'] = x.copy(), cost, np.linalg.norm(grad)
+        return cost, grad.ravel()
+
+    def hessp(x, v):
+        return objective.hessp(x.reshape(d, d), v.reshape(d, d)).ravel()
+
+    def callback(x):
+        if np.array_equal(x, state['x']):
+            cost, grad_norm = state['cost'], state['grad_norm']
+        else:
+            cost, grad = objective.cost_and_grad(x.reshape(d, d))
+            grad_norm = np.linalg.norm(grad)
+        iteration = state['iteration']
+        if display_step > 0 and iteration % display_step == 0:
+            print("Iteration:", '%04d' % (iteration), "log10(cost)=", "{:.9f}".format(np.log10(cost)))
+        stop = trace is not None and trace.record(iteration, x.reshape(d, d), cost, grad_norm)
+        # a rejected trust-region step leaves x, hence the cost, unchanged
+        if state['previous_x'] is None or not np.array_equal(x, state['previous_x']):
+            stop = stop or has_converged(state['previous_cost'], cost, grad_norm, tol, gtol)
+            state['previous_cost'] = cost
+            state['previous_x'] = x.copy()
+        state['iteration'] += 1
+        if stop:
+            raise StopIteration
+
+    options = {'maxiter': max_iter}
+    if method == 'newton-cg':
+        options['xtol'] = 0.
+    else:
+        options['gtol'] = 0.
+    res = minimize(fun, np.asarray(R0, dtype=np.float64).ravel(), jac=True, hessp=hessp, method=method,
+                   callback=callback, options=options)
+    return res.x.reshape(d, d), res.fun
+
+
+def solve_lbfgs_batch(L, C, K_c, R0, alpha, max_iter=1000, memory=10, tol=1e-10, gtol=0., display_step=100,
+                      max_backtracking=50):
+    """
+    Minimizes the objectives of n_problems independent problems with the same dimension and number of
+    realizations at once, with an L-BFGS algorithm vectorized over the problems: the costs and
+    gradients of all the problems are computed with the same batched matrix products, each problem
+    keeping its own history of `memory` pairs, its own Armijo backtracking line search and its own
+    convergence test `has_converged(..., tol, gtol)`. A problem which converged (or whose line search
+    failed after `max_backtracking` halvings) is masked out of the following iterations.
+
+    Parameters
+    ----------
+
+        L : `np.array` shape=(n_problems,n_days,dim)
+
+        C, K_c : `np.array` shape=(n_problems,n_days,dim,dim)
+
+        R0 : `np.array` shape=(n_problems,dim,dim)
+            The starting points
+
+        alpha : `float` or `np.array` shape=(n_problems,)
+
+    Returns
+    -------
+
+        R : `np.array` shape=(n_problems,dim,dim)
+
+        costs : `np.array` shape=(n_problems,)
+
+        n_iter : `np.array` shape=(n_problems,)
+            The number of iterations run for each problem
+
+        converged : `np.array` shape=(n_problems,) of `bool`
+            Whether each problem stopped on the convergence test before `max_iter`
+    """
+    L = np.asarray(L, dtype=np.float64)
+    C = np.asarray(C, dtype=np.float64)
+    K_c = np.asarray(K_c, dtype=np.float64)
+    n_problems, n_days, d = L.shape
+    alpha = np.broadcast_to(np.asarray(alpha, dtype=np.float64), (n_problems,))
+
+    def batch_cost_and_grad(R, problems):
+        cost, grad = cost_and_grad(R[:, None], L[problems], C[problems], K_c[problems], alpha[problems, None])
+        return np.mean(cost, axis=1), np.mean(grad, axis=1).reshape(len(problems), d * d)
+
+    X = np.array(R0, dtype=np.float64).reshape(n_problems, d * d)
+    all_problems = np.arange(n_problems)
+    costs, grads = batch_cost_and_grad(X.reshape(n_problems, d, d), all_problems)
+    # ring buffers of the pairs (s, y), a pair with rho = 0 being unused
+    S = np.zeros((memory, n_problems, d * d))
+    Y = np.zeros((memory, n_problems, d * d))
+    rho = np.zeros((memory, n_problems))
+    n_iter = np.zeros(n_problems, dtype=np.int64)
+    active = np.ones(n_problems, dtype=bool)
+    converged = np.zeros(n_problems, dtype=bool)
+
+    for iteration in range(max_iter):
+        problems = np.flatnonzero(active)
+        if len(problems) == 0:
+            break
+        g = grads[problems]
+        # two-loop recursion, from the most recent pair to the oldest
+        q = g.copy()
+        a = np.zeros((memory, len(problems)))
+        for k in range(iteration - 1, iteration - 1 - memory, -1):
+            ix = k % memory
+            a[ix] = rho[ix, problems] * np.sum(S[ix, problems] * q, axis=1)
+            q -= a[ix][:, None] * Y[ix, problems]
+        last = (iteration - 1) % memory
+        y_last = Y[last, problems]
+        y_sq = np.sum(y_last ** 2, axis=1)
+        has_pair = rho[last, problems] > 0
+        # scaling of the initial Hessian, ||g||^{-1} before the first pair
+        gamma = np.where(has_pair, 1. / np.where(has_pair, rho[last, problems] * y_sq, 1.),
+                         1. / np.maximum(np.linalg.norm(g, axis=1), 1e-300))
+        r = gamma[:, None] * q
+        for k in range(iteration - memory, iteration):
+            ix = k % memory
+            b = rho[ix, problems] * np.sum(Y[ix, problems] * r, axis=1)
+            r += S[ix, problems] * (a[ix] - b)[:, None]
+        direction = -r
+        slope = np.sum(g * direction, axis=1)
+        # not a descent direction: fall back on the gradient
+        bad = slope >= 0
+        direction[bad] = -g[bad]
+        slope[bad] = -np.sum(g[bad] ** 2, axis=1)
+
+        # backtracking line searches, the pending problems being evaluated together
+        step = np.ones(len(problems))
+        accepted = np.zeros(len(problems), dtype=bool)
+        new_costs = np.zeros(len(problems))
+        new_grads = np.zeros_like(g)
+        for _ in range(max_backtracking):
+            pending = np.flatnonzero(~accepted)
+            if len(pending) == 0:
+                break
+            X_try = X[problems[pending]] + step[pending, None] * direction[pending]
+            cost_try, grad_try = batch_cost_and_grad(X_try.reshape(len(pending), d, d), problems[pending])
+            ok = cost_try <= costs[problems[pending]] + 1e-4 * step[pending] * slope[pending]
+            ok &= np.isfinite(cost_try)
+            new_costs[pending[ok]] = cost_try[ok]
+            new_grads[pending[ok]] = grad_try[ok]
+            accepted[pending[ok]] = True
+            step[pending[~ok]] *= .5
+
+        # problems whose line search failed are stopped where they are
+        active[problems[~accepted]] = False
+        problems, step, direction = problems[accepted], step[accepted], direction[accepted]
+        new_costs, new_grads = new_costs[accepted], new_grads[accepted]
+        s = step[:, None] * direction
+        y = new_grads - grads[problems]
+        sy = np.sum(s * y, axis=1)
+        ix = iteration % memory
+        S[ix, problems] = s
+        Y[ix, problems] = y
+        rho[ix, problems] = np.where(sy > 1e-300, 1. / np.where(sy > 1e-300, sy, 1.), 0.)
+        previous_costs = costs[problems]
+        X[problems] += s
+        costs[problems] = new_costs
+        grads[problems] = new_grads
+        n_iter[problems] += 1
+
+        grad_norms = np.linalg.norm(new_grads, axis=1)
+        done = np.zeros(len(problems), dtype=bool)
+        if tol > 0:
+            done |= np.abs(previous_costs - new_costs) <= tol * np.maximum(np.abs(previous_costs), np.abs(new_costs))
+        if gtol > 0:
+            done |= grad_norms <= gtol
+        converged[problems[done]] = True
+        active[problems[done]] = False
+        if display_step > 0 and iteration % display_step == 0:
+            print("Iteration:", '%04d' % (iteration), "active problems:", np.sum(active),
+                  "max log10(cost)=", "{:.9f}".format(np.log10(np.max(costs))))
+
+    return X.reshape(n_problems, d, d), costs, n_iter, converged
+
+
+def solve_path_segment(L, C, K_c, alpha, l_l1_grid, l_l2, R0, l_mu=0., max_iter=1000, tol=1e-10, space='R'):
+    """
+    Solves the problems with penalties (l_l1, l_l2) for l_l1 in `l_l1_grid`, in this order,
+    each one being warm-started from the solution of the previous one, with `solve_lbfgs` in `space`.
+
+    Returns
+    -------
+
+        R_path : `np.array` shape=(len(l_l1_grid),dim,dim)
+
+        costs : `np.array` shape=(len(l_l1_grid),)
+    """
+    d = R0.shape[0]
+    R_path = np.zeros((len(l_l1_grid), d, d))
+    costs = np.zeros(len(l_l1_grid))
+    R = R0
+    for ix, l_l1 in enumerate(l_l1_grid):
+        objective = NPHCObjective(L, C, K_c, alpha=alpha, l_l1=l_l1, l_l2=l_l2, l_mu=l_mu)
+        R, costs[ix] = solve_lbfgs(objective, R, max_iter=max_iter, display_step=0, tol=tol, space=space)
+        R_path[ix] = R
+    return R_path, costs
+
+
+def constraint_projection(L_avg, C_avg, use_projection=False, projection_stable_G=False, projection_method='exact'):
+    """
+    Returns the projection of R applied by the TensorFlow solver with `use_projection` (C^{-1/2} R L^{1/2}
+    projected on the orthogonal matrices) and `projection_stable_G` (singular values of
+    G = I - L R^T C^{-1} clipped at 0.99), or None if neither is set.
+    """
+    if not (use_projection or projection_stable_G):
+        return None
+    from scipy.linalg import sqrtm
+    d = len(L_avg)
+    L_avg_sqrt = np.sqrt(L_avg)
+    C_avg_sqrt = np.real(sqrtm(C_avg))
+    C_avg_sqrt_inv = np.linalg.inv(C_avg_sqrt)
+    C_avg_inv = np.linalg.inv(C_avg)
+
+    def project(R):
+        if use_projection:
+            X = np.dot(C_avg_sqrt_inv, np.dot(R, np.diag(L_avg_sqrt)))
+            if projection_method == 'exact':
+                X = orthogonality(X, relaxed=False)
+            else:
+                X = orthogonality_newton_schulz(X)
+            R = np.dot(C_avg_sqrt, np.dot(X, np.diag(1. / L_avg_sqrt)))
+        if projection_stable_G:
+            G = np.eye(d) - np.dot(np.dot(np.diag(L_avg), R.T), C_avg_inv)
+            if projection_method == 'exact':
+                G = stability(G, alpha=.99)
+            else:
+                G = stability_randomized(G, alpha=.99)
+            R = np.dot(C_avg, np.dot(np.eye(d) - G.T, np.diag(1. / L_avg)))
+        return R
+
+    return project
+
+
+def solve_bootstrap_replicates(L, C, K_c, alpha, R0, day_samples, l_l1=0., l_l2=0., l_mu=0., max_iter=1000,
+                               tol=1e-10, use_average=False, use_projection=False, projection_stable_G=False,
+                               projection_method='exact'):
+    """
+    Solves the problems whose realizations are the rows of `day_samples` (indices of days drawn with
+    replacement), each one warm-started from R0 with `solve_lbfgs`. With `use_projection` or
+    `projection_stable_G`, the projections of `constraint_projection` (computed on the cumulants of the
+    replicate) are applied at each step of `solve_fista` in R instead. With `use_average`, the
+    objective uses the averaged cumulants of the replicate, as in `solve`.
+
+    Returns
+    -------
+
+        G : `np.array` shape=(len(day_samples),dim,dim)
+            The estimates of G = I - R^{-1} of the replicates
+    """
+    L, C, K_c = np.asarray(L), np.asarray(C), np.asarray(K_c)
+    d = R0.shape[0]
+    G = np.zeros((len(day_samples), d, d))
+    for ix, days in enumerate(day_samples):
+        cumulants_list = [L[days], C[days], K_c[days]]
+        projection = constraint_projection(np.mean(L[days], axis=0), np.mean(C[days], axis=0), use_projection,
+                                           projection_stable_G, projection_method)
+        if use_average:
+            cumulants_list = [x.mean(axis=0)[None] for x in cumulants_list]
+        objective = NPHCObjective(*cumulants_list, alpha=alpha, l_l1=l_l1, l_l2=l_l2, l_mu=l_mu)
+        if projection is None:
+            R, _ = solve_lbfgs(objective, R0, max_iter=max_iter, display_step=0, tol=tol)
+        else:
+            R, _ = solve_fista(objective, projection(R0), space='R', max_iter=max_iter, display_step=0, tol=tol,
+                               projection=projection)
+        G[ix] = np.eye(d) - np.linalg.inv(R)
+    return G
+
+
+def cross_validation_score(L, C, K_c, L_test, C_test, K_c_test, alpha, R0, max_iter=1000, tol=1e-10):
+    """
+    Solves the problem on the cumulants of the training realizations, L shape=(n_days,dim) and
+    C, K_c shape=(n_days,dim,dim), with `solve_lbfgs` from R0, and returns the `relative_error`
+    of the solution on the held-out cumulants L_test, C_test and K_c_test.
+    """
+    objective = NPHCObjective(L, C, K_c, alpha=alpha)
+    R, _ = solve_lbfgs(objective, R0, max_iter=max_iter, display_step=0, tol=tol)
+    return relative_error(R, L_test, C_test, K_c_test, alpha)
+
+
+def solve_multistart(objective, starts, max_iter=1000, n_stages=4, prune_ratio=10., tol=1e-10, gtol=0., n_jobs=1,
+                     space='R', trace=False):
+    """
+    Minimizes `objective` from each of the starting points in `starts` with L-BFGS-B in `space`. The iterations
+    are split in `n_stages` stages: after each stage, the starts whose cost is larger than
+    `prune_ratio` times the best cost are dropped. The stages run the remaining starts in `n_jobs`
+    parallel jobs. Each stage restarts L-BFGS-B from the last iterate, so the curvature pairs of the
+    previous stage are lost (SciPy does not expose them): use few stages.
+
+    Returns
+    -------
+
+        R : `np.array` shape=(dim,dim)
+            The solution with the lowest cost
+
+        costs : `np.array` shape=(len(starts),)
+            The last cost reached from each start (when it was pruned, or at the end)
+
+        trace : `np.array` or `None`
+            If `trace` is True, the iterations of all the stages from the best start (see `SolverTrace`)
+    """
+    from joblib import Parallel, delayed
+    Rs = [np.asarray(R0, dtype=np.float64) for R0 in starts]
+    costs = np.array([objective.cost(R) for R in Rs])
+    traces = [[] for _ in starts]
+    alive = list(range(len(Rs)))
+    stage_iter = max(1, max_iter // n_stages)
+    for stage in range(n_stages):
+        res = Parallel(n_jobs)(delayed(solve_single_traced)(objective, Rs[ix], 'lbfgs', trace, max_iter=stage_iter,
+                                                            display_step=0, tol=tol, gtol=gtol, space=space)
+                               for ix in alive)
+        for ix, (R, cost, stage_trace) in zip(alive, res):
+            Rs[ix] = R
+            costs[ix] = cost
+            traces[ix].append(stage_trace)
+        best_cost = np.min(costs[alive])
+        alive = [ix for ix in alive if costs[ix] <= prune_ratio * best_cost]
+    best = alive[np.argmin(costs[alive])]
+    return Rs[best], costs, concatenate_traces(traces[best]) if trace else None
+
+
+def solve_fista(objective, R0, space='G', l_l1=0., l_l2=0., stable=False, max_iter=1000, display_step=100,
+                tol=1e-10, gtol=0., step=1., trace=None, projection_method='exact', projection=None):
+    """
+    Minimizes `objective` plus l_l1 * ||X||_1 + l_l2 * ||X||^2 / 2 with the accelerated proximal
+    gradient algorithm (FISTA) and a backtracking line search, X being G = I - R^{-1} if `space`
+    is 'G', or R if `space` is 'R'. The proximal operator of the penalties is
+    `prox_l2(prox_l1(X, step * l_l1), step * l_l2)`; if `stable` is True, the iterates are then
+    projected with `stability` (singular values of G clipped below 1), or with `stability_randomized`
+    if `projection_method` is 'approximate'; in R, the projected G is mapped back to R = (I - G)^{-1}.
+    A function given as `projection` is applied last.
+
+    The penalties of `objective` itself are treated as part of the smooth term: they should be
+    zero, except possibly `l_mu`. The momentum is reset when the objective increases, or when the
+    extrapolated point is outside the domain of the objective.
+
+    Returns
+    -------
+
+        R : `np.array` shape=(dim,dim)
+
+        cost : `float`
+            The cost reached, penalties included
+    """
+    d = R0.shape[0]
+    if space == 'G':
+        smooth = GSpaceObjective(objective)
+        X0 = np.eye(d) - np.linalg.inv(R0)
+    elif space == 'R':
+        smooth = objective
+        X0 = np.asarray(R0, dtype=np.float64)
+    else:
+        raise ValueError("In `solve_fista`: `space` should either equal `G` or `R`.")
+
+    project = stability if projection_method == 'exact' else stability_randomized
+
+    def prox(X, s):
+        res = prox_l2(prox_l1(X, s * l_l1), s * l_l2)
+        if stable and space == 'R':
+            # clip the singular values of G = I - R^{-1}, not those of R
+            res = np.linalg.inv(np.eye(d) - project(np.eye(d) - np.linalg.inv(res)))
+        elif stable:
+            res = project(res)
+        if projection is not None:
+            res = projection(res)
+        return res
+
+    def penalty(X):
+        return l_l1 * np.sum(np.abs(X)) + .5 * l_l2 * np.sum(X ** 2)
+
+    X = prox(X0, 0.)
+    Y = X
+    t = 1.
+    cost = smooth.cost(X) + penalty(X)
+    for iteration in range(max_iter):
+        f_Y, grad_Y = smooth.cost_and_grad(Y)
+        if not np.isfinite(f_Y):
+            # the momentum left the domain (I - Y singular): restart it from the last iterate
+            Y, t = X, 1.
+            f_Y, grad_Y = smooth.cost_and_grad(Y)
+        # let the step grow again before backtracking
+        step *= 2.
+        while True:
+            start_prox = time.time()
+            X_new = prox(Y - step * grad_Y, step)
+            prox_time = time.time() - start_prox
+            diff = X_new - Y
+            f_new = smooth.cost(X_new)
+            if f_new <= f_Y + np.sum(grad_Y * diff) + .5 * np.sum(diff ** 2) / step or step < 1e-300:
+                break
+            step *= .5
+        new_cost = f_new + penalty(X_new)
+        if new_cost > cost:
+            # restart the momentum
+            t = 1.
+        t_new = .5 * (1. + np.sqrt(1. + 4. * t ** 2))
+        Y = X_new + ((t - 1.) / t_new) * (X_new - X)
+        # norm of the gradient mapping, zero at the optimum
+        grad_norm = np.linalg.norm(diff) / step
+        X, t, previous_cost, cost = X_new, t_new, cost, new_cost
+        if display_step > 0 and iteration % display_step == 0:
+            print("Iteration:", '%04d' % (iteration), "log10(cost)=", "{:.9f}".format(np.log10(cost)))
+        R = smooth.to_R(X) if space == 'G' else X
+        stop = trace is not None and trace.record(iteration, R, cost, grad_norm, prox_time)
+        if stop or has_converged(previous_cost, cost, grad_norm, tol, gtol):
+            break
+    if space == 'G':
+        return smooth.to_R(X), cost
+    return X, cost
+
+
+def armijo_step(objective, R, cost, grad, step=1.):
+    """
+    Largest step of the form step * 2^k which satisfies the Armijo condition
+    cost(R - step * grad) <= cost - step * ||grad||^2 / 2.
+    """
+    sq_norm = np.sum(grad ** 2)
+
+    def sufficient_decrease(s):
+        return objective.cost(R - s * grad) <= cost - .5 * s * sq_norm
+
+    if sufficient_decrease(step):
+        while step < 1e300 and sufficient_decrease(2. * step):
+            step *= 2.
+    else:
+        while step > 1e-300 and not sufficient_decrease(step):
+            step *= .5
+    return step
+
+
+def solve_variance_reduced(objective, R0, method='svrg', step=None, n_epochs=100, batch_size=1, display_step=10,
+                           tol=1e-10, gtol=0., trace=None, random_state=None):
+    """
+    Minimizes `objective` with a variance-reduced stochastic gradient algorithm over the realizations:
+    each step uses the gradients of `batch_size` realizations drawn at random, corrected by stored gradients.
+
+    * 'svrg': at the start of each epoch, the full gradient is computed at a snapshot R_s, then each step
+    uses grad_i(R) - grad_i(R_s) + grad(R_s)
+    * 'saga': the last gradient of each realization is stored, each step uses
+    grad_i(R) - stored_i + mean(stored) and replaces stored_i by grad_i(R)
+
+    An epoch is n_days / batch_size steps. If `step` is None, it is half the step found by `armijo_step`
+    along the full gradient at R0. An epoch which increases the cost is cancelled and the step halved,
+    so that no tuning of the step is needed. The cost over all the realizations is checked with
+    `has_converged(..., tol, gtol)` after each epoch, and recorded in `trace` if a `SolverTrace` is given.
+
+    Returns
+    -------
+
+        R : `np.array` shape=(dim,dim)
+
+        cost : `float`
+            The cost reached
+    """
+    if method not in ('svrg', 'saga'):
+        raise ValueError("In `solve_variance_reduced`: `method` should either equal `svrg` or `saga`.")
+    rng = np.random.RandomState(random_state)
+    n_days = objective.n_days
+    n_steps = max(1, n_days // batch_size)
+    penalized = objective.l_l1 > 0 or objective.l_l2 > 0 or objective.l_mu > 0
+    R = np.asarray(R0, dtype=np.float64)
+    cost, grad = objective.cost_and_grad(R)
+    if step is None:
+        step = .5 * armijo_step(objective, R, cost, grad)
+    if method == 'saga':
+        stored = objective.day_costs_and_grads(R, np.arange(n_days))[1]
+        stored_mean = np.mean(stored, axis=0)
+
+    for epoch in range(n_epochs):
+        R_epoch = R.copy()
+        if method == 'saga':
+            stored_epoch, stored_mean_epoch = stored.copy(), stored_mean.copy()
+        for _ in range(n_steps):
+            days = rng.randint(0, n_days, batch_size)
+            if method == 'svrg':
+                _, grad_days = objective.cost_and_grad(R, days)
+                _, grad_snapshot = objective.cost_and_grad(R_epoch, days)
+                direction = grad_days - grad_snapshot + grad
+            else:
+                grads = objective.day_costs_and_grads(R, days)[1]
+                direction = np.mean(grads - stored[days], axis=0) + stored_mean
+                if penalized:
+                    direction += objective.penalties(R)[1]
+                # one by one, so that stored_mean stays the mean of stored
+                for day, grad_day in zip(days, grads):
+                    stored_mean += (grad_day - stored[day]) / n_days
+                    stored[day] = grad_day
+            R = R - step * direction
+
+        new_cost, new_grad = objective.cost_and_grad(R)
+        if not new_cost <= cost:
+            # cancel the epoch
+            R = R_epoch
+            step *= .5
+            if method == 'saga':
+                stored, stored_mean = stored_epoch, stored_mean_epoch
+            continue
+        previous_cost, cost, grad = cost, new_cost, new_grad
+        grad_norm = np.linalg.norm(grad)
+        if display_step > 0 and epoch % display_step == 0:
+            print("Epoch:", '%04d' % (epoch), "log10(cost)=", "{:.9f}".format(np.log10(cost)))
+        stop = trace is not None and trace.record(epoch, R, cost, grad_norm)
+        if stop or has_converged(previous_cost, cost, grad_norm, tol, gtol):
+            break
+    return R, cost
+
+
+def solve_numpy(L, C, K_c, starts, alpha, l_l1=0., l_l2=0., positive_baselines=False, l_mu=0., training_epochs=1000,
+                display_step=100, use_average=False, use_projection=False, projection_stable_G=False,
+                projection_method='exact', batch_size=1, n_jobs=1, tol=None, gtol=None, callback=None, trace=False,
+                solver='lbfgs', space=None, **kwargs):
+    """
+    The 'numpy' backend of `NPHC.solve` (see `nphc.backends`), which runs the solvers of this module.
+    """
+    if use_projection or (projection_stable_G and solver != 'fista'):
+        raise ValueError("In `solve`: this projection is not supported by the solver `%s`." % solver)
+    cumulants_list = [L, C, K_c]
+    if use_average:
+        cumulants_list = [[np.mean(x, axis=0)] for x in cumulants_list]
+    objective = NPHCObjective(*cumulants_list, alpha=alpha, l_l1=l_l1, l_l2=l_l2,
+                              l_mu=l_mu if positive_baselines else 0.)
+    if callback is not None and len(starts) > 1:
+        raise ValueError("In `solve`: `callback` is not supported with `n_starts` > 1 and `backend='numpy'`, "
+                         "the starts run in parallel jobs.")
+    solver_trace = SolverTrace(callback) if trace or callback is not None else None
+    start_point = starts[0]
+    if tol is None:
+        tol = 1e-14 if solver == 'newton' else 1e-10
+    if gtol is None:
+        gtol = 0.
+
+    if solver not in ('lbfgs', 'fista', 'svrg', 'saga', 'newton'):
+        raise ValueError("In `solve`: `solver` should be one of `lbfgs`, `fista`, `svrg`, `saga` or `newton`.")
+    if solver == 'fista':
+        # the penalties on G are handled by the proximal operators
+        objective.l_l1 = objective.l_l2 = 0.
+    options = dict(max_iter=training_epochs, tol=tol, gtol=gtol, space=space, l_l1=l_l1, l_l2=l_l2,
+                   stable=projection_stable_G, projection_method=projection_method, batch_size=batch_size)
+
+    if len(starts) > 1:
+        if solver == 'lbfgs':
+            R, start_costs, best_trace = solve_multistart(objective, starts, max_iter=training_epochs, tol=tol,
+                                                          gtol=gtol, n_jobs=n_jobs, space=space or 'R', trace=trace)
+        else:
+            # no pruning: the other solvers run every start to the end
+            from joblib import Parallel, delayed
+            res = Parallel(n_jobs)(delayed(solve_single_traced)(objective, R0, solver, trace, display_step=0, **options)
+                                   for R0 in starts)
+            start_costs = np.array([cost for (_, cost, _) in res])
+            R, _, best_trace = res[np.argmin(start_costs)]
+        print("Optimization Finished!")
+        return R, np.min(start_costs), start_costs, best_trace
+    R, cost = solve_single(objective, start_point, solver, display_step=display_step, trace=solver_trace, **options)
+    print("Optimization Finished!")
+    return R, cost, np.array([cost]), solver_trace.to_array() if solver_trace is not None else None
+
+
+def solve_single(objective, R0, solver, max_iter=1000, display_step=100, tol=1e-10, gtol=0., trace=None, space=None,
+                 l_l1=0., l_l2=0., stable=False, projection_method='exact', batch_size=1):
+    """
+    Runs `solver` ('lbfgs', 'fista', 'svrg', 'saga' or 'newton') on `objective` from R0, and returns
+    the solution and the cost reached. `l_l1`, `l_l2`, `stable` and `projection_method` are only used by 'fista'.
+    """
+    if solver == 'lbfgs':
+        return solve_lbfgs(objective, R0, max_iter=max_iter, display_step=display_step, tol=tol, gtol=gtol,
+                           trace=trace, space=space or 'R')
+    elif solver == 'fista':
+        return solve_fista(objective, R0, space=space or 'G', l_l1=l_l1, l_l2=l_l2, stable=stable,
+                           max_iter=max_iter, display_step=display_step, tol=tol, gtol=gtol, trace=trace,
+                           projection_method=projection_method)
+    elif solver in ('svrg', 'saga'):
+        return solve_variance_reduced(objective, R0, method=solver, n_epochs=max_iter, batch_size=batch_size,
+                                      display_step=display_step, tol=tol, gtol=gtol, trace=trace)
+    elif solver == 'newton':
+        return solve_newton(objective, R0, max_iter=max_iter, display_step=display_step, tol=tol, gtol=gtol,
+                            trace=trace)
+    raise ValueError("In `solve`: `solver` should be one of `lbfgs`, `fista`, `svrg`, `saga` or `newton`.")
+
+
+def solve_single_traced(objective, R0, solver, trace=False, **kwargs):
+    """
+    `solve_single` for the parallel jobs, which can not share a `SolverTrace` with the caller: returns the
+    solution, the cost reached and, if `trace` is True, the output of `SolverTrace.to_array` (None otherwise).
+    """
+    solver_trace = SolverTrace() if trace else None
+    R, cost = solve_single(objective, R0, solver, trace=solver_trace, **kwargs)
+    return R, cost, solver_trace.to_array() if trace else None
@@ -0,0 +1,257 @@
+from nphc.solvers import SolverTrace, has_converged
+from nphc.utils.prox import orthogonality, orthogonality_newton_schulz, stability, stability_randomized
+from scipy.linalg import inv, sqrtm
+import tensorflow as tf
+import numpy as np
+import time
+
+
+class TFSolver(object):
+    """
+    The TensorFlow graph of the objective minimized in `NPHC.solve`, with its optimizer and session.
+    The graph is built once for a given dimension and structure of the objective; the cumulants,
+    `alpha`, the penalties, the learning rate and the starting point are fed at each call to `solve`,
+    so that repeated solves do not grow the graph.
+
+    Use `get_tf_solver` to reuse the solvers across calls.
+
+
+    Parameters
+    ----------
+
+        dim : `int`
+            Dimension of the process
+
+        regularized : `bool`
+            Whether the graph contains the l1 and l2 penalties on G = I - R^{-1}
+
+        positive_baselines : `bool`
+            Whether the graph contains the penalty on negative baselines
+
+        optimizer : `str`
+            The TensorFlow optimizer used to minimize the objective function
+    """
+
+    def __init__(self, dim, regularized=False, positive_baselines=False, optimizer='momentum'):
+        object.__init__(self)
+        d = dim
+        self.dim = dim
+        self.graph = tf.Graph()
+
+        with self.graph.as_default():
+            self.R_init = tf.placeholder(tf.float64, (d,d), name='R_init')
+            self.L = tf.placeholder(tf.float64, (None,d), name='L')
+            self.C = tf.placeholder(tf.float64, (None,d,d), name='C')
+            self.K_c = tf.placeholder(tf.float64, (None,d,d), name='K_c')
+            self.alpha = tf.placeholder(tf.float64, (), name='alpha')
+            self.l_l1 = tf.placeholder(tf.float64, (), name='l_l1')
+            self.l_l2 = tf.placeholder(tf.float64, (), name='l_l2')
+            self.l_mu = tf.placeholder(tf.float64, (), name='l_mu')
+            self.L_avg = tf.placeholder(tf.float64, (d,), name='L_avg')
+            self.learning_rate = tf.placeholder(tf.float64, (), name='learning_rate')
+
+            R = tf.Variable(self.R_init, name='R', dtype=tf.float64)
+            self.R = R
+            I = tf.constant(np.eye(d), dtype=tf.float64)
+
+            # Construct model, batched over the first axis of the cumulants
+            R_L = tf.expand_dims(R, 0) * tf.expand_dims(self.L, 1)
+            activation_3 = tf.einsum('nij,kj->nik', self.C, tf.square(R)) + 2.0*tf.einsum('ij,nkj->nik', R, tf.expand_dims(R, 0)*self.C) \
+                           - 2.0*tf.einsum('nij,kj->nik', R_L, tf.square(R))
+            activation_2 = tf.einsum('nij,kj->nik', R_L, R)
+
+            # the mean over the stacked realizations is the average of the costs of each realization
+            cost = (1-self.alpha) * tf.reduce_mean( tf.squared_difference( activation_3, self.K_c ) ) \
+                   + self.alpha * tf.reduce_mean( tf.squared_difference( activation_2, self.C ) )
+
+            if regularized:
+                G = I - tf.matrix_inverse(R)
+                # same values as tf.contrib.layers.l1_regularizer and l2_regularizer
+                cost += self.l_l1 * tf.reduce_sum(tf.abs(G)) + self.l_l2 * tf.nn.l2_loss(G)
+
+            if positive_baselines:
+                neg_baselines = - tf.matmul(tf.matrix_inverse(R), tf.reshape(self.L_avg, (d,1)))
+                cost += self.l_mu * tf.reduce_sum(tf.nn.relu(neg_baselines))
+
+            self.cost = cost
+            self.grad_norm = tf.norm(tf.gradients(cost, R)[0])
+
+            if optimizer == 'momentum':
+                self.train_op = tf.train.MomentumOptimizer(self.learning_rate, momentum=0.9).minimize(cost)
+            elif optimizer == 'adam':
+                self.train_op = tf.train.AdamOptimizer(self.learning_rate).minimize(cost)
+            elif optimizer == 'adagrad':
+                self.train_op = tf.train.AdagradOptimizer(self.learning_rate).minimize(cost)
+            elif optimizer == 'rmsprop':
+                self.train_op = tf.train.RMSPropOptimizer(self.learning_rate).minimize(cost)
+            elif optimizer == 'adadelta':
+                self.train_op = tf.train.AdadeltaOptimizer(self.learning_rate).minimize(cost)
+            else:
+                self.train_op = tf.train.GradientDescentOptimizer(self.learning_rate).minimize(cost)
+
+            # used by the projections, built once
+            self.R_new = tf.placeholder(tf.float64, (d,d), name='R_new')
+            self.assign_op = R.assign(self.R_new)
+
+            # also resets the state of the optimizer
+            self.init = tf.global_variables_initializer()
+
+        self.graph.finalize()
+        self.sess = tf.Session(graph=self.graph)
+
+    def solve(self, L, C, K_c, start_point, alpha, l_l1=0., l_l2=0., l_mu=0., training_epochs=1000, learning_rate=1e6,
+              display_step=100, use_average=False, use_projection=False, projection_stable_G=False, batch_size=1,
+              tol=0., gtol=0., trace=None, projection_method='exact', projection_period=1):
+        """
+        Runs the training cycle from `start_point` with the stacked cumulants L shape=(n_days,dim),
+        C and K_c shape=(n_days,dim,dim), and returns the final R.
+
+        If `tol` or `gtol` is positive, or if a `nphc.solvers.SolverTrace` is given, the cost over all
+        the realizations and the norm of its gradient are computed after each epoch; the cycle stops
+        as soon as `nphc.solvers.has_converged` holds.
+
+        The projections run every `projection_period` epochs. With `projection_method='approximate'`,
+        the projection on orthogonal matrices uses `orthogonality_newton_schulz` and the projection on
+        stable G clips the leading singular values found by `stability_randomized`, instead of full SVDs.
+        """
+        if projection_method not in ('exact', 'approximate'):
+            raise ValueError("In `solve`: `projection_method` should either equal `exact` or `approximate`.")
+        d = self.dim
+        L_stack = np.asarray(L, dtype=np.float64)
+        C_stack = np.asarray(C, dtype=np.float64)
+        K_c_stack = np.asarray(K_c, dtype=np.float64)
+        n_days = len(L_stack)
+
+        # always use the average cumulants over all realizations
+        L_avg = np.mean(L_stack, axis=0)
+        C_avg = np.mean(C_stack, axis=0)
+        K_avg = np.mean(K_c_stack, axis=0)
+        # the projection on orthogonal matrices only follows the stochastic steps
+        use_projection = use_projection and not use_average
+        if use_projection:
+            L_avg_sqrt = np.sqrt(L_avg)
+            L_avg_sqrt_inv = 1./L_avg_sqrt
+            C_avg_sqrt = sqrtm(C_avg)
+            C_avg_sqrt_inv = inv(C_avg_sqrt)
+        if projection_stable_G:
+            C_avg_inv = inv(C_avg)
+
+        params = {self.alpha: alpha, self.l_l1: l_l1, self.l_l2: l_l2, self.l_mu: l_mu, self.L_avg: L_avg,
+                  self.learning_rate: learning_rate}
+
+        def feed(i):
+            res = {self.L: L_stack[i], self.C: C_stack[i], self.K_c: K_c_stack[i]}
+            res.update(params)
+            return res
+
+        all_days = np.arange(n_days)
+        feed_avg = {self.L: L_avg[None], self.C: C_avg[None], self.K_c: K_avg[None]}
+        feed_avg.update(params)
+
+        sess = self.sess
+        sess.run(self.init, feed_dict={self.R_init: start_point.astype(np.float64)})
+        monitor = tol > 0 or gtol > 0 or trace is not None
+        previous_cost = None
+
+        # Training cycle
+        for epoch in range(training_epochs):
+
+            if epoch % display_step == 0:
+                avg_cost = sess.run(self.cost, feed_dict=feed(all_days))
+                print("Epoch:", '%04d' % (epoch), "log10(cost)=", "{:.9f}".format(np.log10(avg_cost)))
+
+            if use_average:
+                sess.run(self.train_op, feed_dict=feed_avg)
+            else:
+                # Fit training using batch data
+                i = np.random.randint(0, n_days, batch_size)
+                sess.run(self.train_op, feed_dict=feed(i))
+
+            projection_time = 0.
+            if (use_projection or projection_stable_G) and (epoch + 1) % projection_period == 0:
+                start_projection = time.time()
+                R_projected = sess.run(self.R)
+                if use_projection:
+                    to_be_projected = np.dot(C_avg_sqrt_inv,np.dot(R_projected,np.diag(L_avg_sqrt)))
+                    if projection_method == 'exact':
+                        projected = orthogonality(to_be_projected, relaxed=False)
+                    else:
+                        projected = orthogonality_newton_schulz(to_be_projected)
+                    R_projected = np.dot( C_avg_sqrt, np.dot( projected, np.diag(L_avg_sqrt_inv) ) )
+                if projection_stable_G:
+                    to_be_projected = np.eye(d) - np.dot( np.dot(np.diag(L_avg), R_projected.T), C_avg_inv)
+                    if projection_method == 'exact':
+                        G_projected = stability(to_be_projected, alpha=.99)
+                    else:
+                        G_projected = stability_randomized(to_be_projected, alpha=.99)
+                    R_projected = np.dot(C_avg, np.dot( np.eye(d) - G_projected.T, np.diag(1./L_avg) ) )
+                sess.run(self.assign_op, feed_dict={self.R_new: R_projected})
+                projection_time = time.time() - start_projection
+
+            if monitor:
+                cost, grad_norm = sess.run([self.cost, self.grad_norm], feed_dict=feed(all_days))
+                stop = trace is not None and trace.record(epoch, sess.run(self.R), cost, grad_norm, projection_time)
+                if stop or has_converged(previous_cost, cost, grad_norm, tol, gtol):
+                    break
+                previous_cost = cost
+
+        self.optcost = sess.run(self.cost, feed_dict=feed(all_days))
+        print("Optimization Finished!")
+
+        return sess.run(self.R)
+
+    def close(self):
+        self.sess.close()
+
+
+# solvers already built, by (dim, regularized, positive_baselines, optimizer)
+_solvers = {}
+
+
+def get_tf_solver(dim, regularized=False, positive_baselines=False, optimizer='momentum'):
+    """
+    Returns the `TFSolver` for this structure of the objective, building it on the first call.
+    """
+    key = (dim, regularized, positive_baselines, optimizer)
+    if key not in _solvers:
+        _solvers[key] = TFSolver(dim, regularized, positive_baselines, optimizer)
+    return _solvers[key]
+
+
+def clear_tf_solvers():
+    for solver in _solvers.values():
+        solver.close()
+    _solvers.clear()
+
+
+def solve_tensorflow(L, C, K_c, starts, alpha, l_l1=0., l_l2=0., positive_baselines=False, l_mu=0.,
+                     training_epochs=1000, learning_rate=1e6, optimizer='momentum', display_step=100,
+                     use_average=False, use_projection=False, projection_stable_G=False, projection_method='exact',
+                     projection_period=1, batch_size=1, tol=None, gtol=None, callback=None, trace=False, **kwargs):
+    """
+    The 'tensorflow' backend of `NPHC.solve` (see `nphc.backends`), which runs the cached `TFSolver`
+    from each start.
+    """
+    d = len(L[0])
+    solver = get_tf_solver(d, regularized=(l_l1 > 0 or l_l2 > 0), positive_baselines=positive_baselines,
+                           optimizer=optimizer)
+    if tol is None:
+        tol = 0.
+    if gtol is None:
+        gtol = 0.
+    solver_trace = None
+    solutions = []
+    traces = []
+    for start in starts:
+        if trace or callback is not None:
+            solver_trace = SolverTrace(callback)
+        R = solver.solve(L, C, K_c, start, alpha, l_l1=l_l1, l_l2=l_l2, l_mu=l_mu,
+                         training_epochs=training_epochs, learning_rate=learning_rate, display_step=display_step,
+                         use_average=use_average, use_projection=use_projection, projection_stable_G=projection_stable_G,
+                         batch_size=batch_size, tol=tol, gtol=gtol, trace=solver_trace,
+                         projection_method=projection_method, projection_period=projection_period)
+        solutions.append((solver.optcost, R))
+        traces.append(solver_trace.to_array() if solver_trace is not None else None)
+    start_costs = np.array([cost for (cost, _) in solutions])
+    best = np.argmin(start_costs)
+    return solutions[best][1], start_costs[best], start_costs, traces[best]
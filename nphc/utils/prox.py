@@ -51,3 +51,57 @@ def prox_nuclear(X, lbd=1.):
     s_thres = prox_l1(s, lbd=lbd)
     return np.dot(U,np.dot(np.diag(s_thres),V))
 
+
+def leading_svd(X, rank, n_iter=2, random_state=None):
+    """
+    Randomized SVD of the `rank` leading singular triplets of X (Halko, Martinsson and Tropp),
+    with `n_iter` power iterations to sharpen the range. Returns U, s, V as `np.linalg.svd`.
+    """
+    rng = np.random.RandomState(random_state)
+    Q, _ = np.linalg.qr(np.dot(X, rng.randn(X.shape[1], rank)))
+    for _ in range(n_iter):
+        Q, _ = np.linalg.qr(np.dot(X.T, Q))
+        Q, _ = np.linalg.qr(np.dot(X, Q))
+    U_B, s, V = np.linalg.svd(np.dot(Q.T, X), full_matrices=False)
+    return np.dot(Q, U_B), s, V
+
+def stability_randomized(X, alpha=0.999, rank=10, n_iter=4, random_state=None):
+    """
+    Approximation of `stability` which only computes the leading singular values with `leading_svd`:
+    the rank doubles until the smallest computed singular value is below `alpha`, and the full SVD
+    is used once it reaches the dimension. Only the singular values above `alpha` are clipped.
+    """
+    d = min(X.shape)
+    while rank < d:
+        U, s, V = leading_svd(X, rank, n_iter=n_iter, random_state=random_state)
+        if s[-1] <= alpha:
+            excess = np.maximum(s - alpha, 0.)
+            return X - np.dot(U * excess, V)
+        rank *= 2
+    return stability(X, alpha=alpha)
+
+def orthogonality_newton_schulz(X, n_iter=5, n_power_iter=5, tol=1e-3):
+    """
+    Approximation of `orthogonality(X, relaxed=False)`, the orthogonal polar factor U V^T of X, with
+    `n_iter` Newton-Schulz iterations X <- X (3 I - X^T X) / 2, after scaling X by an estimate of its
+    spectral norm from `n_power_iter` power iterations. Only uses matrix products; accurate in a few
+    iterations when X is close to orthogonal, e.g. right after a gradient step from a projected point.
+
+    The iterations converge for singular values in (0, sqrt(3)) only, and the power iterations may
+    underestimate the spectral norm: if ||X^T X - I||_F is above `tol` at the end, the exact
+    projection is returned instead.
+    """
+    X0 = X
+    v = np.ones(X.shape[1]) / np.sqrt(X.shape[1])
+    for _ in range(n_power_iter):
+        v = np.dot(X.T, np.dot(X, v))
+        v /= np.linalg.norm(v)
+    X = X / np.linalg.norm(np.dot(X, v))
+    # a diverging iteration overflows, it is caught by the test below
+    with np.errstate(over='ignore', invalid='ignore'):
+        for _ in range(n_iter):
+            X = 1.5 * X - .5 * np.dot(X, np.dot(X.T, X))
+        error = np.linalg.norm(np.dot(X.T, X) - np.eye(X.shape[1]))
+    if not np.isfinite(error) or error > tol:
+        return orthogonality(X0, relaxed=False)
+    return X
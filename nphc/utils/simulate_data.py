@@ -319,6 +319,48 @@ def save(cumul, Alpha, Beta, Gamma, kernel, mode, T, with_params=True, without_N
         f.close()
 
 
+def simulate_poisson(L, T, random_state=None):
+    """
+    Simulates independent Poisson processes of intensities `L` on [0, T].
+    Returns a list of np.arrays of time stamps, one per component.
+    """
+    rng = np.random.RandomState(random_state)
+    return [np.sort(rng.uniform(0., T, rng.poisson(l * T))) for l in L]
+
+
+def simulate_hawkes_exp(mu, Alpha, Beta, T, random_state=None):
+    r"""
+    Simulates a multivariate Hawkes process with exponential kernels
+    \phi^{ij}(t) = Alpha[i, j] * Beta[i, j] * exp(-Beta[i, j] t) on [0, T], with numpy only, through
+    its cluster representation: the immigrants of N^i are a Poisson process of intensity mu[i], and every
+    jump of N^j has Poisson(Alpha[i, j]) children in N^i, delayed by Exp(Beta[i, j]) times.
+    The spectral radius of `Alpha` should be below 1.
+
+    Returns a list of np.arrays of time stamps, one per component.
+    """
+    rng = np.random.RandomState(random_state)
+    d = len(mu)
+    Alpha = np.asarray(Alpha, dtype=np.float64)
+    Beta = np.asarray(Beta, dtype=np.float64)
+    assert np.max(np.abs(np.linalg.eigvals(Alpha))) < 1, "The spectral radius of Alpha should be below 1."
+    generation = [rng.uniform(0., T, rng.poisson(m * T)) for m in mu]
+    res = [[x] for x in generation]
+    while any(len(x) > 0 for x in generation):
+        children = [[] for _ in range(d)]
+        for j in range(d):
+            if len(generation[j]) == 0:
+                continue
+            for i in np.flatnonzero(Alpha[:, j]):
+                n_children = rng.poisson(Alpha[i, j], len(generation[j]))
+                parents = np.repeat(generation[j], n_children)
+                t = parents + rng.exponential(1. / Beta[i, j], len(parents))
+                children[i].append(t[t < T])
+        generation = [np.concatenate(x) if len(x) > 0 else np.zeros(0) for x in children]
+        for i in range(d):
+            res[i].append(generation[i])
+    return [np.sort(np.concatenate(x)) for x in res]
+
+
 if __name__ == '__main__':
 
     import argparse
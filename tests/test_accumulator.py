@@ -0,0 +1,143 @@
+import numpy as np
+import pytest
+
+from nphc.accumulator import CumulantsAccumulator, merge_accumulators
+from nphc.cumulants import Cumulants
+from nphc.utils.simulate_data import simulate_hawkes_exp
+
+MU = np.array([.5, .5, .5])
+ALPHA = np.array([[.3, .1, 0.], [.2, .3, 0.], [0., .2, .3]])
+BETA = np.ones((3, 3))
+HALF_WIDTH = 5.
+
+
+def simulate(T, n_days=1, dim=3):
+    return [simulate_hawkes_exp(MU[:dim], ALPHA[:dim, :dim], BETA[:dim, :dim], T, random_state=seed)
+            for seed in range(n_days)]
+
+
+def day_accumulator(realization, full_moments=False, filtr='rectangular', sigma=1.0):
+    return CumulantsAccumulator(len(realization), HALF_WIDTH, filtr, sigma, full_moments).add_day(realization)
+
+
+def assert_same_accumulator(acc, other, exact=False):
+    check = np.testing.assert_array_equal if exact else np.testing.assert_allclose
+    assert (acc.dim, acc.half_width, acc.filtr, acc.sigma, acc.full_moments) == \
+           (other.dim, other.half_width, other.filtr, other.sigma, other.full_moments)
+    check(acc.time, other.time)
+    for name in acc._fields:
+        check(getattr(acc, name), getattr(other, name))
+
+
+@pytest.mark.parametrize('full_moments', [False, True])
+def test_merge_subtract_round_trip(full_moments):
+    acc_1, acc_2, acc_3 = [day_accumulator(day, full_moments) for day in simulate(300., n_days=3)]
+    merged = merge_accumulators([acc_1, acc_2, acc_3])
+    assert_same_accumulator(sum([acc_1, acc_2, acc_3]), merged)
+    assert_same_accumulator(acc_3 + acc_1 + acc_2, merged)
+    assert_same_accumulator(merged - acc_2 - acc_3, acc_1)
+    # the cumulants of the merge are those of the days computed together
+    cumul = Cumulants(simulate(300., n_days=3), half_width=HALF_WIDTH)
+    cumul.compute_partial_sums(HALF_WIDTH, full_moments=full_moments)
+    assert_same_accumulator(merge_accumulators(cumul.partial_sums), merged)
+
+
+def test_merge_incompatible():
+    acc = day_accumulator(simulate(100.)[0])
+    with pytest.raises(ValueError):
+        acc.merge(CumulantsAccumulator(3, 2 * HALF_WIDTH))
+    with pytest.raises(TypeError):
+        acc.merge(np.zeros(3))
+
+
+@pytest.mark.parametrize('full_moments', [False, True])
+@pytest.mark.parametrize('filtr', ['rectangular', 'gaussian'])
+def test_serialize_round_trip(tmpdir, full_moments, filtr):
+    acc = day_accumulator(simulate(300.)[0], full_moments, filtr, HALF_WIDTH / 5.)
+    assert_same_accumulator(CumulantsAccumulator.from_bytes(acc.to_bytes()), acc, exact=True)
+    filename = str(tmpdir.join('acc.npz'))
+    acc.save(filename)
+    assert_same_accumulator(CumulantsAccumulator.load(filename), acc, exact=True)
+
+
+def test_partial_sums_converge_to_parallel_by_day():
+    errors = []
+    for T in [1000., 10000.]:
+        cumulants = []
+        for method in ['parallel_by_day', 'partial_sums']:
+            cumul = Cumulants(simulate(T), half_width=HALF_WIDTH)
+            cumul.compute_cumulants(method=method, verbose=False)
+            cumulants.append([cumul.L[0], cumul.C[0], cumul.K_c[0]])
+        # L does not depend on the trigger events
+        np.testing.assert_allclose(cumulants[0][0], cumulants[1][0])
+        errors.append([np.linalg.norm(x - y) / np.linalg.norm(y) for x, y in zip(*cumulants)][1:])
+    errors = np.array(errors)
+    # the trigger events close to the edges are dropped: the difference is O(half_width / T)
+    assert np.all(errors[1] < errors[0])
+    assert np.all(errors[1] < 1e-2)
+
+
+def test_aggregate_nodes_selection():
+    days = simulate(500., n_days=2)
+    cumul = Cumulants(days, half_width=HALF_WIDTH)
+    cumul.compute_partial_sums(HALF_WIDTH)
+    cumul.set_from_partial_sums()
+    nodes = [0, 2]
+    L, C, K_c = cumul.aggregate_nodes([[node] for node in nodes])
+    np.testing.assert_allclose(L, np.array(cumul.L)[:, nodes])
+    np.testing.assert_allclose(C, np.array(cumul.C)[:, nodes][:, :, nodes])
+    np.testing.assert_allclose(K_c, np.array(cumul.K_c)[:, nodes][:, :, nodes])
+
+
+def test_aggregate_nodes_superposition():
+    days = simulate(500., n_days=2)
+    partition = [[0, 1], [2]]
+    cumul = Cumulants(days, half_width=HALF_WIDTH)
+    cumul.compute_partial_sums(HALF_WIDTH, full_moments=True)
+    L, C, K_c = cumul.aggregate_nodes(partition)
+    # the observation windows are unchanged, since every component is in a group
+    superposed = [[np.sort(np.concatenate([day[k] for k in group])) for group in partition] for day in days]
+    direct = Cumulants(superposed, half_width=HALF_WIDTH)
+    direct.compute_cumulants(method='partial_sums', verbose=False)
+    np.testing.assert_allclose(L, np.array(direct.L))
+    np.testing.assert_allclose(C, np.array(direct.C))
+    np.testing.assert_allclose(K_c, np.array(direct.K_c))
+    with pytest.raises(ValueError):
+        day_accumulator(days[0]).aggregate(partition)
+
+
+@pytest.mark.parametrize('method', ['classic', 'parallel_by_day', 'partial_sums'])
+@pytest.mark.parametrize('inside', [True, False])
+def test_add_components(method, inside):
+    days = simulate(500., n_days=2)
+    if inside:
+        for day in days:
+            start, end = max(x[0] for x in day[:2]), min(x[-1] for x in day[:2])
+            day[2] = day[2][(day[2] > start) & (day[2] < end)]
+    else:
+        # the new components extend the observation windows
+        for day in days:
+            day[2] = day[2] + 50.
+    cumul = Cumulants([day[:2] for day in days], half_width=HALF_WIDTH)
+    cumul.compute_cumulants(method=method, verbose=False)
+    cumul.add_components([day[2:] for day in days])
+    direct = Cumulants(days, half_width=HALF_WIDTH)
+    direct.compute_cumulants(method=method, verbose=False)
+    np.testing.assert_allclose(np.array(cumul.L), np.array(direct.L))
+    np.testing.assert_allclose(np.array(cumul.C), np.array(direct.C), atol=1e-12)
+    np.testing.assert_allclose(np.array(cumul.K_c), np.array(direct.K_c), atol=1e-12)
+
+
+def test_rolling():
+    days = simulate(300., n_days=4, dim=2)
+    cumul = Cumulants(days, half_width=HALF_WIDTH)
+    # the partial sums are computed by the first call
+    L, C, K_c = cumul.rolling(2)
+    assert L.shape == (3, 2) and C.shape == (3, 2, 2) and K_c.shape == (3, 2, 2)
+    for w in range(3):
+        L_w, C_w, _, _, K_c_w = merge_accumulators(cumul.partial_sums[w:w + 2]).finalize()
+        np.testing.assert_allclose(L[w], L_w)
+        np.testing.assert_allclose(C[w], C_w, atol=1e-12)
+        np.testing.assert_allclose(K_c[w], K_c_w, atol=1e-12)
+    with pytest.raises(ValueError):
+        cumul.rolling(2, half_width=2 * HALF_WIDTH)